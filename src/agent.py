@@ -5,7 +5,7 @@ This class implements a race car which runs on a racetrack implemented by the
 "Racetrack" class
 '''
 
-from racetrack import Racetrack
+from racetrack import Racetrack, PATH_FINISH, PATH_WALL
 import random
 
 class Agent():
@@ -14,6 +14,7 @@ class Agent():
         self.old_position = position # Coordinates of the car's last position
         self.position = position # Coordinates of the car's current position
         self.velocity = velocity # Velocity of the car
+        self.crashed = False # True if the car ran into a wall in its last move
 
         # Specify one of the two types of crash
         if crash_type == 0:
@@ -43,15 +44,28 @@ class Agent():
             boolean: True if the car will pass the finish line after the update
         '''
         self.old_position = self.position
+        self.crashed = False
         new_position = [self.position[0] + self.velocity[0], \
                         self.position[1] + self.velocity[1]]
 
+        # Either check the whole path, or only the finish line and the new
+        # position
+        if self.track.swept_path:
+            outcome = self.track.path_outcome(self.position, self.velocity)
+            has_finished = outcome == PATH_FINISH
+            hits_wall = outcome == PATH_WALL
+        else:
+            has_finished = self.track.check_finish_line(self.position,
+                                                        new_position)
+            hits_wall = self.track.is_wall(new_position)
+
         # 3 conditions: The car either passes the finish line, runs into a wall
         # or continues to run on the racetrack
-        if self.track.check_finish_line(self.position, new_position):
+        if has_finished:
             return True
-        elif self.track.is_wall(new_position):
+        elif hits_wall:
             self.crash()
+            self.crashed = True
         else:
             self.position = new_position
 
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+
+'''
+Run this module to time the racetrack, the car and the learners on the bundled
+racetracks, on scaled-up copies of them and on large synthetic racetracks from
+"track_generator". Nothing is printed by the models and no input is asked for.
+The timings are written to a JSON file, and can be compared to the timings of
+an earlier run to flag regressions
+'''
+
+from racetrack import Racetrack, read_track
+from agent import Agent
+from value_iteration import ValueIteration
+from q_learning import QLearning
+from transition_model import TransitionModel
+from track_generator import write_track
+from policy_evaluator import PolicyEvaluator
+from trajectory import MAX_STEPS
+import numpy as np
+import contextlib
+import tracemalloc
+import argparse
+import platform
+import tempfile
+import random
+import time
+import json
+import io
+import os
+
+TRACKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                          'tracks')
+TRACKS = ['L-track.txt', 'R-track.txt', 'O-track.txt']
+
+def scale_track(file, factor, out_dir):
+    '''
+    This function writes a copy of a racetrack in which every point is
+    replaced by a square of "factor" x "factor" points of the same type
+
+    INPUT:
+        file(str): Racetrack file to be scaled
+        factor(int): Number of copies of each point along each side
+        out_dir(str): Directory the scaled racetrack is written to
+    OUTPUT:
+        str: Path of the scaled racetrack file
+    '''
+    track = read_track(file)
+    rows = []
+    for row in track:
+        scaled_row = ''.join(val * factor for val in row)
+        rows += [scaled_row] * factor
+
+    name = os.path.basename(file)[:-4] + '-x' + str(factor) + '.txt'
+    path = os.path.join(out_dir, name)
+    with open(path, 'w') as out_file:
+        out_file.write(str(len(rows)) + ',' + str(len(rows[0])) + '\n')
+        for row in rows:
+            out_file.write(row + '\n')
+
+    return path
+
+def best_time(function, repeats):
+    '''
+    This function runs a function several times and keeps the fastest run
+
+    INPUT:
+        function(function): Function without arguments to be timed
+        repeats(int): Number of runs
+    OUTPUT:
+        float: Seconds taken by the fastest run
+    '''
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+def bench_parse(file, repeats):
+    '''
+    This function times loading a racetrack file
+
+    INPUT:
+        file(str): Racetrack file
+        repeats(int): Number of runs
+    OUTPUT:
+        dict: Timings
+    '''
+    return {'parse_seconds': best_time(lambda: Racetrack(file), repeats)}
+
+def bench_agent(track, steps):
+    '''
+    This function times a car driving randomly on a racetrack, one
+    "update_velocity" and one "update_position" per step
+
+    INPUT:
+        track(Racetrack): The racetrack
+        steps(int): Number of steps
+    OUTPUT:
+        dict: Timings
+    '''
+    accelerations = [[i, j] for i in [-1, 0, 1] for j in [-1, 0, 1]]
+    car = Agent(track, track.start_locations[0], [0, 0], 0)
+
+    start = time.perf_counter()
+    for step in range(steps):
+        car.update_velocity(random.choice(accelerations))
+        if car.update_position():
+            car.position = random.choice(track.start_locations)
+            car.velocity = [0, 0]
+    seconds = time.perf_counter() - start
+
+    return {'agent_steps_per_second': steps / seconds}
+
+def bench_memory(file):
+    '''
+    This function measures the peak memory used to create a Value Iteration
+    model, build its transitions and update all states once
+
+    INPUT:
+        file(str): Racetrack file
+    OUTPUT:
+        dict: Peak memory in bytes
+    '''
+    tracemalloc.start()
+    value_iter = ValueIteration(file)
+    model = TransitionModel(value_iter.track, 0, value_iter.indexer)
+    value_iter.v_table = np.array(value_iter.v_table, dtype=float)
+    value_iter.sweep_vectorized(model, 0.95)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'vi_peak_bytes': peak}
+
+def bench_value_iteration(file, loop, rollouts):
+    '''
+    This function times Value Iteration with the mild crash, sweep by sweep
+    and until convergence, and then times test runs of the trained model
+
+    INPUT:
+        file(str): Racetrack file
+        loop(boolean): True to also time the sweeps of the original loops
+        rollouts(boolean): True to time test runs. They are only timed if
+                           the test car finishes from every start point.
+                           With a discount of 0.95 and the 0.1 threshold,
+                           the policy may never reach a finish line that is
+                           too many steps away, and "test" would not return
+    OUTPUT:
+        dict: Timings and the number of states and iterations
+    '''
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Original loops over lists, which are too slow to run to convergence
+        # on large racetracks
+        if loop:
+            value_iter = ValueIteration(file)
+            start = time.perf_counter()
+            value_iter.train(2, 0)
+            seconds = time.perf_counter() - start
+            results['vi_loop_sweep_seconds'] = seconds / 2
+
+        value_iter = ValueIteration(file)
+        start = time.perf_counter()
+        learning_curve = value_iter.train(1000, 0, True)
+        seconds = time.perf_counter() - start
+        results['vi_states'] = value_iter.indexer.num_states
+        results['vi_iterations'] = len(learning_curve)
+        results['vi_sweep_seconds'] = seconds / len(learning_curve)
+        results['vi_convergence_seconds'] = seconds
+
+        # Starting from a converged solution, one sweep is enough
+        warm_iter = ValueIteration(file)
+        learning_curve = warm_iter.train(1000, 0, True, init_from=value_iter)
+        results['vi_warm_start_iterations'] = len(learning_curve)
+        if loop:
+            warm_iter = ValueIteration(file)
+            learning_curve = warm_iter.train(1000, 0, init_from=value_iter)
+            results['vi_loop_warm_start_iterations'] = len(learning_curve)
+
+        # Whether the test car finishes from every start point
+        evaluator = PolicyEvaluator(value_iter, 0)
+        expected_steps = evaluator.exact()['expected_steps']
+        results['vi_always_finishes'] = bool(np.max(expected_steps) <
+                                             MAX_STEPS)
+
+        if rollouts and results['vi_always_finishes']:
+            runs = 20
+            start = time.perf_counter()
+            for run in range(runs):
+                value_iter.test(0, True)
+                value_iter.record.clear()
+            seconds = time.perf_counter() - start
+            results['test_rollouts_per_second'] = runs / seconds
+
+    return results
+
+def bench_q_learning(file, episodes, steps):
+    '''
+    This function times Q-Learning with the mild crash, one car at a time
+    and many cars at once
+
+    INPUT:
+        file(str): Racetrack file
+        episodes(int): Number of training iterations
+        steps(int): Maximum number of steps in each training iteration
+    OUTPUT:
+        dict: Timings
+    '''
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, vectorized in [('ql', False), ('ql_vectorized', True)]:
+            q_learning = QLearning(file)
+            start = time.perf_counter()
+            learning_curve = q_learning.train(episodes, 0, steps, vectorized)
+            seconds = time.perf_counter() - start
+            results[name + '_episodes_per_second'] = episodes / seconds
+            results[name + '_steps_per_second'] = sum(learning_curve) / seconds
+
+    return results
+
+def run_benchmarks(tracks=TRACKS, factors=(2, 4), sizes=(200,), repeats=5,
+                   agent_steps=20000, episodes=200, steps=1000, seed=0):
+    '''
+    This function runs every benchmark on every racetrack. Scaled-up copies
+    of the racetracks and synthetic racetracks are written to a temporary
+    directory
+
+    INPUT:
+        tracks(list): Racetrack files in the "tracks" directory
+        factors(tuple): Scale factors of the scaled-up racetracks
+        sizes(tuple): Numbers of rows and columns of the synthetic racetracks
+        repeats(int): Number of runs of the short benchmarks
+        agent_steps(int): Number of steps of the car benchmark
+        episodes(int): Number of Q-Learning training iterations
+        steps(int): Maximum number of steps in each training iteration
+        seed(int): Random seed
+    OUTPUT:
+        dict: Information about the machine and the timings of each racetrack
+    '''
+    random.seed(seed)
+    np.random.seed(seed)
+    results = {'machine': {'python': platform.python_version(),
+                           'numpy': np.__version__,
+                           'platform': platform.platform(),
+                           'processor': platform.processor()},
+               'tracks': {}}
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        # Name, path, whether the loops are timed and whether test runs are
+        # timed for each racetrack
+        files = []
+        for name in tracks:
+            files.append((name, os.path.join(TRACKS_DIR, name), True, True))
+            for factor in factors:
+                path = scale_track(os.path.join(TRACKS_DIR, name), factor,
+                                   out_dir)
+                files.append((os.path.basename(path), path, False, True))
+        for size in sizes:
+            name = 'generated-' + str(size) + '.txt'
+            path = write_track(os.path.join(out_dir, name), size, size,
+                               turns=2 * (size // 50), seed=seed)
+            files.append((name, path, False, False))
+
+        for name, file, loop, rollouts in files:
+            track = Racetrack(file)
+            timings = {}
+            timings.update(bench_parse(file, repeats))
+            timings.update(bench_agent(track, agent_steps))
+            timings.update(bench_memory(file))
+            timings.update(bench_value_iteration(file, loop, rollouts))
+            timings.update(bench_q_learning(file, episodes, steps))
+            results['tracks'][name] = timings
+            print(name, json.dumps(timings, indent=2))
+
+    return results
+
+def compare(results, baseline, tolerance=0.2):
+    '''
+    This function compares timings to the timings of an earlier run. Timings
+    in seconds and memory in bytes are better when lower, timings per second
+    when higher. A warm start from a converged solution must take one sweep
+
+    INPUT:
+        results(dict): Output of "run_benchmarks"
+        baseline(dict): Output of an earlier "run_benchmarks"
+        tolerance(float): Fraction by which a timing may get worse
+    OUTPUT:
+        list: Description of each regression
+    '''
+    regressions = []
+    for name, timings in results['tracks'].items():
+        old_timings = baseline['tracks'].get(name, {})
+        for key, value in timings.items():
+            if key.endswith('warm_start_iterations') and value != 1:
+                regressions.append(name + ' ' + key + ': ' + str(value) +
+                                   ' sweeps instead of 1')
+            old_value = old_timings.get(key)
+            if old_value is None or old_value <= 0:
+                continue
+            if key.endswith('_seconds') or key.endswith('_bytes'):
+                ratio = value / old_value
+            elif key.endswith('_per_second'):
+                ratio = old_value / value
+            else:
+                continue
+            if ratio > 1 + tolerance:
+                regressions.append(name + ' ' + key + ': ' + format(value, '.4g')
+                                   + ' vs ' + format(old_value, '.4g') + ' ('
+                                   + format(ratio, '.2f') + 'x slower)')
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the racetrack, the car '
+                                     'and the learners')
+    parser.add_argument('--tracks', nargs='+', default=TRACKS,
+                        help='racetrack files in the "tracks" directory')
+    parser.add_argument('--factors', nargs='*', type=int, default=[2, 4],
+                        help='scale factors of the scaled-up racetracks')
+    parser.add_argument('--sizes', nargs='*', type=int, default=[200],
+                        help='numbers of rows and columns of the synthetic '
+                        'racetracks')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--agent-steps', type=int, default=20000)
+    parser.add_argument('--episodes', type=int, default=200)
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark.json',
+                        help='JSON file the timings are written to')
+    parser.add_argument('--baseline',
+                        help='JSON file of an earlier run to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fraction by which a timing may get worse')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.tracks, args.factors, args.sizes,
+                             args.repeats, args.agent_steps, args.episodes,
+                             args.steps, args.seed)
+    with open(args.output, 'w') as out_file:
+        json.dump(results, out_file, indent=2)
+
+    # Without a baseline only the warm starts are checked
+    baseline = {'tracks': {}}
+    if args.baseline:
+        with open(args.baseline) as in_file:
+            baseline = json.load(in_file)
+    regressions = compare(results, baseline, args.tolerance)
+    print()
+    for regression in regressions:
+        print('Regression:', regression)
+    if regressions:
+        raise SystemExit(1)
+    print('--> No regressions')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+'''
+This class draws a racetrack on the console. Each frame is built as one string
+and written with a single call. A recorded run of a car can be replayed at a
+chosen frame rate, redrawing only the points that change with ANSI cursor
+moves
+'''
+
+import time
+import sys
+
+CLEAR_SCREEN = '\x1b[2J\x1b[H' # Clears the console and moves to the top left
+SHOW_CURSOR = '\x1b[?25h'
+HIDE_CURSOR = '\x1b[?25l'
+
+class ConsoleRenderer():
+    def __init__(self, out_file=None):
+        self.out_file = out_file # Where frames are written, the console if None
+
+    def frame(self, track):
+        '''
+        This method turns a racetrack into the text of one frame
+
+        INPUT:
+            track(list): Racetrack as a 2D list of points, which may be
+                         characters or step numbers
+        OUTPUT:
+            str: One line for each row of the racetrack
+        '''
+        return ''.join(''.join(str(val) for val in row) + '\n'
+                       for row in track)
+
+    def write(self, text):
+        '''
+        This method writes text in one call and flushes it
+
+        INPUT:
+            text(str): Text to be written
+        '''
+        out_file = self.out_file
+        if out_file is None:
+            out_file = sys.stdout
+        out_file.write(text)
+        out_file.flush()
+
+    def replay(self, track, positions, fps=10, velocities=None):
+        '''
+        This method replays the run of a car. The racetrack is drawn once,
+        then each frame only moves the car and rewrites the status line
+
+        INPUT:
+            track(list): Racetrack as a 2D list of characters
+            positions(list): Coordinates of the car at each step
+            fps(float): Frames per second, as fast as possible if 0
+            velocities(list): Velocity of the car at each step, if known
+        '''
+        rows = len(track)
+        status_row = rows + 2
+        self.write(HIDE_CURSOR + CLEAR_SCREEN + self.frame(track))
+
+        previous = None
+        start = time.perf_counter()
+        try:
+            for step in range(len(positions)):
+                row, col = int(positions[step][0]), int(positions[step][1])
+
+                # Put back the point the car left and draw the car
+                parts = []
+                if previous is not None:
+                    parts.append(self.move(previous[0], previous[1]) +
+                                 str(track[previous[0]][previous[1]]))
+                parts.append(self.move(row, col) + 'C')
+                status = 'Step: ' + str(step)
+                if velocities is not None:
+                    velocity = [int(v) for v in velocities[step]]
+                    status += '  Velocity: ' + str(velocity)
+                parts.append('\x1b[' + str(status_row) + ';1H\x1b[2K' + status)
+                self.write(''.join(parts))
+                previous = (row, col)
+
+                # Wait for the time of the next frame
+                if fps > 0:
+                    delay = start + (step + 1) / fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        finally:
+            self.write('\x1b[' + str(status_row + 1) + ';1H' + SHOW_CURSOR)
+
+    def move(self, row, col):
+        '''
+        This method makes the ANSI code which moves the cursor to a point of
+        the racetrack drawn at the top left of the console
+
+        INPUT:
+            row(int): Row of the point
+            col(int): Column of the point
+        OUTPUT:
+            str: The ANSI code
+        '''
+        return '\x1b[' + str(row + 1) + ';' + str(col + 1) + 'H'
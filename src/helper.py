@@ -1,24 +1,45 @@
 #!/usr/bin/env python3
 
 '''
-This is an auxiliary class for both the "ValueIteration" class and the
-"QLearning" class
+This is an auxiliary class for the "ValueIteration", "PolicyIteration" and
+"QLearning" classes
 '''
 
 from racetrack import Racetrack
 from agent import Agent
+from state_indexer import StateIndexer
+from transition_model import TransitionModel
+from console_renderer import ConsoleRenderer
+from trajectory import Trajectory
+from results_writer import render_trajectory
 import numpy as np
+import hashlib
 import random
+import json
 import copy
+import os
 
 class Helper:
-    def __init__(self, track):
+    def __init__(self, track, reachable_only=False):
         self.track = track # A Racetrack object
+        self.indexer = StateIndexer(track) # Numbers the states of the car
         self.print_track = copy.deepcopy(track.track) # Copy of the racetrack
         self.cache = 'S' # Memorize the type of point the car was located at
-        self.record = [] # Stores all the past locations the car was at
+        self.record = Trajectory() # Stores all the past states of the car
         self.iter = 0 # Number of iterations for the test car to reach the goal
         self.print_start = True # Indicates the first iteration
+        self.reachable_only = reachable_only # Only reachable states are kept
+        self.crash_type = None # Crash type of the last training
+        self.hyperparameters = {} # Hyperparameters of the last training
+        self.renderer = ConsoleRenderer() # Draws the racetrack on the console
+
+        # Only keep the states a car can reach from the starting line with
+        # either type of crash
+        if reachable_only:
+            models = [TransitionModel(track, crash_type, self.indexer)
+                      for crash_type in [0, 1]]
+            reachable = self.indexer.find_reachable(models)
+            self.indexer = self.indexer.restrict(reachable)
 
     def initialize_car(self, crash_type):
         '''
@@ -35,12 +56,14 @@ class Helper:
 
         return car
 
-    def act(self, agent):
+    def act(self, agent, action=-1):
         '''
         This method updates the position of the test car
 
         INPUT:
             agent(Agent): The test car
+            action(int): Index of the acceleration the car took, to be
+                         recorded
         OUTPUT:
             boolearn: True if the test car has reached the finish line
         '''
@@ -52,7 +75,8 @@ class Helper:
             return True
 
         self.iter += 1
-        self.record.append(agent.position)
+        self.record.append(self.iter, agent.position, agent.velocity, action,
+                           agent.crashed)
 
         # Update the position of the test car in the racetrack to be printed
         # Test car is represented as "C" when printed in the racetrack
@@ -71,11 +95,6 @@ class Helper:
         INPUT:
             agent(Agent): The test car
         '''
-        print()
-        print('Iteration:', self.iter)
-        print('Velocity:', agent.velocity)
-        print('------------')
-
         if self.print_start:
             self.print_track[agent.old_position[0]][agent.old_position[1]] \
                                                                    = self.cache
@@ -83,10 +102,11 @@ class Helper:
             self.print_track[agent.position[0]][agent.position[1]] = 'C'
             self.print_start = False
 
-        for row in self.print_track:
-            for val in row:
-                print(val, end='')
-            print()
+        # Each frame is written at once
+        self.renderer.write('\nIteration: ' + str(self.iter) + '\n' +
+                            'Velocity: ' + str(agent.velocity) + '\n' +
+                            '------------\n' +
+                            self.renderer.frame(self.print_track))
 
     def print_last(self, agent):
         '''
@@ -95,31 +115,32 @@ class Helper:
         INPUT:
             agent(Agent): The test car
         '''
-        print()
-        print('Velocity:', agent.velocity)
-        print('------------')
-        for row in self.print_track:
-            for val in row:
-                print(val, end='')
-            print()
-        print()
-        print('--> Finished!!')
+        self.renderer.write('\nVelocity: ' + str(agent.velocity) + '\n' +
+                            '------------\n' +
+                            self.renderer.frame(self.print_track) +
+                            '\n--> Finished!!\n')
 
     def print_all(self):
         '''
         This method prints the states of the test car in all iterations
         '''
-        print('Car positions from all iterations')
-        print('---------------------------------')
-
-        for i in range(len(self.record)):
-            position = self.record[i]
+        for i, position in enumerate(self.record.positions().tolist()):
             self.print_track[position[0]][position[1]] = i
 
-        for row in self.print_track:
-            for val in row:
-                print(val, end='')
-            print()
+        self.renderer.write('Car positions from all iterations\n' +
+                            '---------------------------------\n' +
+                            self.renderer.frame(self.print_track))
+
+    def replay(self, fps=10):
+        '''
+        This method replays the last test run on the console, moving the car
+        from one recorded position to the next at a chosen frame rate
+
+        INPUT:
+            fps(float): Frames per second, as fast as possible if 0
+        '''
+        self.renderer.replay(self.track.track, self.record.positions(), fps,
+                             self.record.velocities())
 
     def write_all(self, out_file):
         '''
@@ -129,17 +150,158 @@ class Helper:
         INPUT:
             out_file(_io.TextIOWrapper): The output file being written to
         '''
-        out_file.write('Car positions from all iterations\n')
-        out_file.write('---------------------------------\n')
+        out_file.write(render_trajectory(self.track.track,
+                                         self.record.positions()))
 
-        temp_track = copy.deepcopy(self.track.track)
-        for i in range(len(self.record)):
-            position = self.record[i]
-            temp_track[position[0]][position[1]] = i
+        self.record.clear()
 
-        for row in temp_track:
-            for val in row:
-                out_file.write(str(val))
-            out_file.write('\n')
+    def metadata(self):
+        '''
+        This method describes what the tables of the model were trained on
 
-        self.record.clear()
+        OUTPUT:
+            dict: Model, racetrack, state space and training settings
+        '''
+        with open(self.track.file, 'rb') as track_file:
+            track_hash = hashlib.sha256(track_file.read()).hexdigest()
+
+        return {'model': type(self).__name__,
+                'track_file': os.path.basename(self.track.file),
+                'track_hash': track_hash,
+                'reachable_only': self.reachable_only,
+                'swept_path': self.track.swept_path,
+                'num_states': self.indexer.num_states,
+                'crash_type': self.crash_type,
+                'hyperparameters': self.hyperparameters}
+
+    def save(self, path):
+        '''
+        This method saves the tables of the model. A path ending with ".npz"
+        is written as one compressed file. Any other path is written as a
+        directory of ".npy" files, which "load" memory-maps. The states of
+        the rows of the tables are saved too, for "warm_start"
+
+        INPUT:
+            path(str): Path of the file or directory
+        '''
+        metadata = self.metadata()
+        tables = {'states': self.indexer.states}
+        for name in self.tables:
+            tables[name] = np.asarray(getattr(self, name))
+
+        if path.endswith('.npz'):
+            np.savez_compressed(path, metadata=np.array(json.dumps(metadata)),
+                                **tables)
+        else:
+            os.makedirs(path, exist_ok=True)
+            for name, table in tables.items():
+                np.save(os.path.join(path, name + '.npy'), table)
+            with open(os.path.join(path, 'metadata.json'), 'w') as out_file:
+                json.dump(metadata, out_file, indent=2)
+
+    def load(self, path):
+        '''
+        This method loads tables saved by "save". Tables in a directory are
+        memory-mapped copy-on-write, so nothing is read until it is used and
+        the files are never changed
+
+        INPUT:
+            path(str): Path of the file or directory
+        '''
+        tables = {}
+        if path.endswith('.npz'):
+            with np.load(path) as data:
+                metadata = json.loads(str(data['metadata']))
+                for name in self.tables:
+                    tables[name] = data[name]
+        else:
+            with open(os.path.join(path, 'metadata.json')) as in_file:
+                metadata = json.load(in_file)
+            for name in self.tables:
+                tables[name] = np.load(os.path.join(path, name + '.npy'),
+                                       mmap_mode='c')
+
+        # Refuse tables trained on another racetrack or state space
+        expected = self.metadata()
+        for key in ['model', 'track_hash', 'reachable_only', 'swept_path',
+                    'num_states']:
+            if metadata[key] != expected[key]:
+                raise ValueError('Cannot load ' + path + ': ' + key + ' is ' +
+                                 str(metadata[key]) + ', expected ' +
+                                 str(expected[key]))
+
+        for name, table in tables.items():
+            setattr(self, name, table)
+        self.crash_type = metadata['crash_type']
+        self.hyperparameters = metadata['hyperparameters']
+
+    def warm_start(self, source):
+        '''
+        This method seeds the tables of the model from an earlier solution.
+        States are matched by position and velocity, so the solution may come
+        from another crash type, model or version of the racetrack. Values
+        of states the solution does not have are left unchanged
+
+        INPUT:
+            source(Helper or str): A trained model, or a path saved by "save"
+        OUTPUT:
+            int: Number of states seeded
+        '''
+        # Read the tables of the solution and the state of each row
+        if isinstance(source, str):
+            tables = {}
+            if source.endswith('.npz'):
+                with np.load(source) as data:
+                    for name in data.files:
+                        tables[name] = data[name]
+            else:
+                for name in os.listdir(source):
+                    if name.endswith('.npy'):
+                        tables[name[:-4]] = np.load(os.path.join(source, name))
+            states = tables.pop('states')
+        else:
+            tables = {}
+            for name in source.tables:
+                tables[name] = np.asarray(getattr(source, name))
+            states = source.indexer.states
+
+        # A value table can be derived from a Q table, and action indices
+        if 'v_table' not in tables and 'q_table' in tables:
+            tables['v_table'] = np.max(tables['q_table'], axis=1)
+        # from a policy table. A model that was never trained has a flat
+        # policy table of 0s, which is no policy at all
+        if 'p_table' in tables and tables['p_table'].ndim != 2:
+            del tables['p_table']
+        if 'actions' not in tables and 'p_table' in tables:
+            policy = tables['p_table']
+            tables['actions'] = (policy[:, 0] + 1)*3 + (policy[:, 1] + 1)
+
+        # Match the states of the solution to the states of this model
+        rows, cols = self.indexer.shape[0], self.indexer.shape[1]
+        inside = (states[:, 0] < rows) & (states[:, 1] < cols)
+        targets = np.full(len(states), -1)
+        targets[inside] = self.indexer.index[tuple(states[inside].T)]
+        sources = np.flatnonzero(targets >= 0)
+        targets = targets[sources]
+
+        for name in self.tables:
+            if name not in tables:
+                continue
+            seed = tables[name]
+            table = np.array(getattr(self, name))
+            if table.shape[1:] != seed.shape[1:]:
+                table = np.zeros((self.indexer.num_states,) + seed.shape[1:],
+                                 dtype=seed.dtype)
+
+            # Tables start as lists of integer 0s, which would cut the seeded
+            # values down to integers. Policies and actions stay integers
+            if (name in ['v_table', 'q_table'] and
+                    not np.issubdtype(table.dtype, np.floating)):
+                table = table.astype(np.result_type(seed.dtype, float))
+            table[targets] = seed[sources]
+            setattr(self, name, table)
+
+        print('Warm start:', len(targets), 'of', self.indexer.num_states,
+              'states seeded')
+
+        return len(targets)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+'''
+This class compiles a racetrack, a type of crash and a chance that accelerating
+fails into a Markov decision process of sparse matrices. Row s * 9 + m of the
+transition matrix holds the chances of moving from state s to each state with
+action m without finishing, and the reward table holds the expected reward of
+each state-action pair. Backups are then sparse matrix-vector products. The
+process can be saved to a ".npz" file and shared between processes. SciPy is
+only imported when a process is built, loaded or solved
+'''
+
+from transition_model import TransitionModel
+import numpy as np
+import hashlib
+import json
+
+class MDP():
+    def __init__(self, track, crash_type, failure_probability=0.0,
+                 indexer=None):
+        from scipy import sparse
+
+        model = TransitionModel(track, crash_type, indexer)
+        self.crash_type = crash_type # 0 for mild crash and 1 for harsh crash
+        self.failure_probability = failure_probability # Chance of [0, 0]
+        self.num_states = model.num_states
+        self.num_actions = model.num_actions
+        with open(track.file, 'rb') as track_file:
+            self.track_hash = hashlib.sha256(track_file.read()).hexdigest()
+
+        # The chosen action is taken, or [0, 0] when accelerating fails.
+        # Passing the finish line ends the race with reward 0, other moves
+        # give reward -1
+        outcomes = [(np.arange(self.num_actions), 1 - failure_probability)]
+        if failure_probability > 0:
+            outcomes.append((np.full(self.num_actions, 4), failure_probability))
+
+        pairs = np.arange(self.num_states * self.num_actions)
+        rows, cols, chances = [], [], []
+        self.rewards = np.zeros((self.num_states, self.num_actions))
+        for actions, chance in outcomes:
+            finished = model.finished[:, actions]
+            next_state = model.next_state[:, actions]
+            self.rewards -= chance * ~finished
+            rows.append(pairs[~finished.ravel()])
+            cols.append(next_state.ravel()[~finished.ravel()])
+            chances.append(np.full(len(rows[-1]), chance))
+
+        self.transitions = sparse.csr_matrix(
+            (np.concatenate(chances), (np.concatenate(rows),
+                                       np.concatenate(cols))),
+            shape=(len(pairs), self.num_states))
+
+    def backup(self, v_table, discount):
+        '''
+        This method finds the Q value of each state-action pair from the
+        values of the states
+
+        INPUT:
+            v_table(ndarray): Value of each state
+            discount(float): Discount factor
+        OUTPUT:
+            ndarray: Q value of each state-action pair
+        '''
+        q = self.transitions @ v_table
+        return self.rewards + discount * q.reshape(self.num_states,
+                                                   self.num_actions)
+
+    def value_iteration(self, discount=0.95, threshold=0.1, iterations=1000):
+        '''
+        This method finds the values and the best actions of the states with
+        Value Iteration, the same way as "ValueIteration.sweep_vectorized"
+
+        INPUT:
+            discount(float): Discount factor
+            threshold(float): Maximum value difference at convergence
+            iterations(int): Maximum number of training iterations allowed
+        OUTPUT:
+            ndarray: Value of each state
+            ndarray: Index of the best action of each state
+            list: Maximum value difference of each iteration
+        '''
+        v_table = np.zeros(self.num_states)
+        best = np.full(self.num_states, 4) # [0, 0] until the first iteration
+        past_value_difference = []
+        for iteration in range(iterations):
+            q = self.backup(v_table, discount)
+            best = np.argmax(q, axis=1)
+            max_q = q[np.arange(self.num_states), best]
+            max_delta_q = float(max(0, np.max(v_table - max_q)))
+            v_table = max_q
+            past_value_difference.append(max_delta_q)
+            if max_delta_q < threshold:
+                break
+
+        return v_table, best, past_value_difference
+
+    def evaluate(self, actions, discount):
+        '''
+        This method finds the value of each state under a policy by solving
+        (I - discount * P) v = r, where P and r are the transitions and
+        rewards of the actions of the policy
+
+        INPUT:
+            actions(ndarray): Index of the action of each state
+            discount(float): Discount factor
+        OUTPUT:
+            ndarray: Value of each state
+        '''
+        from scipy import sparse
+        from scipy.sparse.linalg import spsolve
+
+        states = np.arange(self.num_states)
+        moves = self.transitions[states * self.num_actions + actions]
+        system = (sparse.identity(self.num_states, format='csc')
+                  - discount * moves.tocsc())
+
+        return spsolve(system, self.rewards[states, actions])
+
+    def policy_iteration(self, discount=0.95, iterations=1000):
+        '''
+        This method finds the values and the best actions of the states with
+        Policy Iteration. As in "PolicyIteration.improve", an action is only
+        replaced by a better one. Unlike there, it must be better by more than
+        1e-9, since the values from the sparse solver carry rounding errors
+        that could make two equal actions swap forever
+
+        INPUT:
+            discount(float): Discount factor
+            iterations(int): Maximum number of training iterations allowed
+        OUTPUT:
+            ndarray: Value of each state
+            ndarray: Index of the action of each state
+            list: Number of states whose policy changed in each iteration
+        '''
+        states = np.arange(self.num_states)
+        v_table = np.zeros(self.num_states)
+        actions = np.full(self.num_states, 4) # Index of [0, 0]
+        past_policy_changes = []
+        for iteration in range(iterations):
+            v_table = self.evaluate(actions, discount)
+            q = self.backup(v_table, discount)
+            best = np.argmax(q, axis=1)
+            is_better = q[states, best] > q[states, actions] + 1e-9
+            actions = np.where(is_better, best, actions)
+            past_policy_changes.append(int(np.sum(is_better)))
+            if not is_better.any():
+                break
+
+        return v_table, actions, past_policy_changes
+
+    def save(self, path):
+        '''
+        This method saves the process to a ".npz" file
+
+        INPUT:
+            path(str): Path of the file
+        '''
+        metadata = {'crash_type': self.crash_type,
+                    'failure_probability': self.failure_probability,
+                    'track_hash': self.track_hash,
+                    'num_states': self.num_states,
+                    'num_actions': self.num_actions}
+        np.savez_compressed(path, metadata=np.array(json.dumps(metadata)),
+                            data=self.transitions.data,
+                            indices=self.transitions.indices,
+                            indptr=self.transitions.indptr,
+                            rewards=self.rewards)
+
+def load_mdp(path):
+    '''
+    This function loads a process saved by "MDP.save"
+
+    INPUT:
+        path(str): Path of the file
+    OUTPUT:
+        MDP: The process
+    '''
+    from scipy import sparse
+
+    mdp = MDP.__new__(MDP)
+    with np.load(path) as data:
+        metadata = json.loads(str(data['metadata']))
+        for key, value in metadata.items():
+            setattr(mdp, key, value)
+        mdp.rewards = data['rewards']
+        mdp.transitions = sparse.csr_matrix(
+            (data['data'], data['indices'], data['indptr']),
+            shape=(mdp.num_states * mdp.num_actions, mdp.num_states))
+
+    return mdp
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+'''
+This class runs the sweeps of synchronous Value Iteration in a pool of
+processes. The states are split into bands of racetrack rows, one for each
+process. The values of the last sweep and of the current sweep, and the
+transitions of the racetrack, are kept in shared memory, so the processes
+read and write them without copying any table. The only synchronization is
+once per sweep, when the processes report the maximum value difference of
+their band
+'''
+
+from multiprocessing import Pool, shared_memory
+import numpy as np
+import os
+
+attached = {} # Arrays in shared memory seen by a process of the pool
+
+class ParallelSweep():
+    def __init__(self, model, discount, v_table, failure_probability=0.0,
+                 workers=None):
+        if workers is None:
+            workers = os.cpu_count()
+        self.bands = self.row_bands(model, workers) # First and last states
+
+        # Row 0 and row 1 of the values take turns holding the values of the
+        # last sweep
+        self.blocks = {} # Shared memory of each array
+        self.arrays = {} # Each array, backed by its shared memory
+        specs = {} # Name, shape and data type of each shared array
+        for name, array in [('values', np.array([v_table, v_table],
+                                                dtype=float)),
+                            ('next_state', model.next_state),
+                            ('finished', model.finished)]:
+            block = shared_memory.SharedMemory(create=True,
+                                               size=max(1, array.nbytes))
+            shared = np.ndarray(array.shape, array.dtype, buffer=block.buf)
+            shared[...] = array
+            self.blocks[name] = block
+            self.arrays[name] = shared
+            specs[name] = (block.name, array.shape, array.dtype.str)
+        self.current = 0 # Row of the values holding the latest values
+
+        self.pool = Pool(min(workers, len(self.bands)), initializer=attach,
+                         initargs=(specs, discount, failure_probability))
+
+    def row_bands(self, model, workers):
+        '''
+        This method splits the states into bands of racetrack rows with about
+        the same number of states. The states of a row are next to each
+        other, since "StateIndexer" numbers them in the order of the rows
+
+        INPUT:
+            model(TransitionModel): Transitions of the racetrack
+            workers(int): Number of processes
+        OUTPUT:
+            list: First state and last state + 1 of each band
+        '''
+        rows = model.indexer.states[:, 0]
+        targets = np.linspace(0, len(rows), workers + 1)[1:-1].astype(int)
+        cuts = np.searchsorted(rows, rows[targets]) if len(rows) else []
+        cuts = np.unique(np.concatenate([[0], cuts, [len(rows)]]))
+
+        return [(int(first), int(last))
+                for first, last in zip(cuts[:-1], cuts[1:])]
+
+    def sweep(self):
+        '''
+        This method updates the value of every state once, from the values of
+        the last sweep, as "ValueIteration.sweep_vectorized" does
+
+        OUTPUT:
+            float: Maximum value difference between the old and new values
+        '''
+        tasks = [(first, last, self.current) for first, last in self.bands]
+        deltas = self.pool.map(sweep_band, tasks, chunksize=1)
+        self.current = 1 - self.current
+
+        return max(deltas, default=0.0)
+
+    def values(self, previous=False):
+        '''
+        This method copies the values out of shared memory
+
+        INPUT:
+            previous(boolean): True for the values the last sweep started from
+        OUTPUT:
+            ndarray: Value of each state
+        '''
+        row = self.current
+        if previous:
+            row = 1 - row
+
+        return self.arrays['values'][row].copy()
+
+    def close(self):
+        '''
+        This method stops the processes and frees the shared memory
+        '''
+        self.pool.close()
+        self.pool.join()
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def attach(specs, discount, failure_probability):
+    '''
+    This function opens the shared arrays in a process of the pool
+
+    INPUT:
+        specs(dict): Name, shape and data type of each shared array
+        discount(float): Discount factor
+        failure_probability(float): Chance that an attempt to accelerate fails
+    '''
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        attached[name + '_block'] = block
+        attached[name] = np.ndarray(shape, dtype, buffer=block.buf)
+    attached['discount'] = discount
+    attached['failure_probability'] = failure_probability
+
+def sweep_band(task):
+    '''
+    This function updates the values of a band of states in a process of the
+    pool. The Q values are found as in "ValueIteration.q_values"
+
+    INPUT:
+        task(tuple): First state and last state + 1 of the band, and the row
+                     of the values holding the values of the last sweep
+    OUTPUT:
+        float: Maximum value difference of the band
+    '''
+    first, last, current = task
+    old_v = attached['values'][current]
+    new_v = attached['values'][1 - current]
+    discount = attached['discount']
+    failure_probability = attached['failure_probability']
+
+    # Reward is 0 when the car passes the finish line and -1 otherwise
+    q = np.where(attached['finished'][first:last], 0.0,
+                 -1 + discount*old_v[attached['next_state'][first:last]])
+    if failure_probability > 0:
+        q = (1 - failure_probability)*q + failure_probability*q[:, 4:5]
+    max_q = np.max(q, axis=1)
+    max_delta_q = max(0, np.max(old_v[first:last] - max_q))
+    new_v[first:last] = max_q
+
+    return float(max_delta_q)
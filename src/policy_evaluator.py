@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+'''
+This class evaluates the policy of a trained model from every start point at
+once. Instead of racing one "Agent" at a time as "test" does, it moves
+thousands of cars together through the transitions of a "TransitionModel", or
+finds the expected number of steps exactly with one sparse linear solve
+'''
+
+from transition_model import TransitionModel
+import numpy as np
+
+class PolicyEvaluator():
+    def __init__(self, learner, crash_type):
+        self.learner = learner # A trained model
+        self.crash_type = crash_type # 0 for mild crash and 1 for harsh crash
+        self.model = TransitionModel(learner.track, crash_type,
+                                     learner.indexer)
+        self.actions = self.policy_actions() # Action taken in each state
+        self.starts = np.array(learner.track.start_locations, dtype=int)
+
+    def policy_actions(self):
+        '''
+        This method finds the action the trained model takes in each state,
+        the same way as its "test" method
+
+        OUTPUT:
+            ndarray: Index of the action of each state
+        '''
+        if hasattr(self.learner, 'p_table'):
+            policy = np.asarray(self.learner.p_table, dtype=int)
+            return (policy[:, 0] + 1)*3 + (policy[:, 1] + 1)
+
+        return np.argmax(np.asarray(self.learner.q_table), axis=1)
+
+    def monte_carlo(self, rollouts=1000, failure_probability=0.0,
+                    max_steps=1000, percentiles=(5, 25, 50, 75, 95),
+                    seed=None):
+        '''
+        This method races many cars from each start point with the policy.
+        The number of steps includes the last acceleration, which takes the
+        car across the finish line. A car that has not finished after the
+        maximum number of steps, as in "QLearning.test", has failed
+
+        INPUT:
+            rollouts(int): Number of cars raced from each start point
+            failure_probability(float): Chance that an attempt to accelerate
+                                        fails, 0 as in "test" and 0.2 as in
+                                        "QLearning.train"
+            max_steps(int): Number of steps after which a car has failed
+            percentiles(tuple): Percentiles of the numbers of steps
+            seed(int): Random seed of the failed accelerations
+        OUTPUT:
+            dict: For each start point, in the order of "starts": the mean,
+                  variance and percentiles of the numbers of steps of the cars
+                  that finished (NaN if none did) and the fraction of cars
+                  that failed. "steps" has the number of steps of every car,
+                  -1 for failed cars
+        '''
+        rng = np.random.default_rng(seed)
+        model = self.model
+        start_states = self.learner.indexer.start_states()
+
+        # One car for each rollout from each start point
+        states = np.repeat(start_states, rollouts)
+        steps = np.full(len(states), -1)
+        cars = np.arange(len(states)) # Cars that have not finished
+
+        for step in range(1, max_steps + 1):
+            if len(cars) == 0:
+                break
+            car_states = states[cars]
+            actions = self.actions[car_states]
+            if failure_probability > 0:
+                fails = rng.random(len(cars)) < failure_probability
+                actions = np.where(fails, 4, actions) # Index of [0, 0]
+
+            finished = model.finished[car_states, actions]
+            steps[cars[finished]] = step
+            states[cars] = model.next_state[car_states, actions]
+            cars = cars[~finished]
+
+        steps = steps.reshape(len(start_states), rollouts)
+        finished = steps >= 0
+        counts = finished.sum(axis=1)
+        finished_steps = np.where(finished, steps, np.nan)
+
+        # Statistics over the cars that finished, without warnings when no
+        # car did
+        mean = np.full(len(steps), np.nan)
+        variance = np.full(len(steps), np.nan)
+        quantiles = np.full((len(steps), len(percentiles)), np.nan)
+        some = counts > 0
+        if some.any():
+            mean[some] = np.nanmean(finished_steps[some], axis=1)
+            variance[some] = np.nanvar(finished_steps[some], axis=1)
+            quantiles[some] = np.nanpercentile(finished_steps[some],
+                                               percentiles, axis=1).T
+
+        return {'starts': self.starts,
+                'mean': mean,
+                'variance': variance,
+                'percentiles': dict(zip(percentiles, quantiles.T)),
+                'failure_rate': 1 - counts / rollouts,
+                'steps': steps}
+
+    def exact(self, failure_probability=0.0):
+        '''
+        This method finds the expected number of steps to the finish line
+        from each start point exactly. The states the policy can reach from
+        the starting line are found first. A state from which the car may
+        never finish, because it can reach states that never lead to the
+        finish line, needs infinitely many steps. For the other states,
+        the expected numbers of steps T solve T = 1 + P T, where P holds
+        the chances of moving between them without finishing
+
+        INPUT:
+            failure_probability(float): Chance that an attempt to accelerate
+                                        fails, 0 as in "test" and 0.2 as in
+                                        "QLearning.train"
+        OUTPUT:
+            dict: For each start point, in the order of "starts": the
+                  expected number of steps, including the last acceleration
+                  (inf if the car may never finish), and whether the car
+                  always finishes
+        '''
+        from scipy import sparse
+        from scipy.sparse.linalg import spsolve
+
+        model = self.model
+        states = np.arange(model.num_states)
+
+        # The chosen action is taken, or [0, 0] when accelerating fails
+        outcomes = [(self.actions, 1 - failure_probability)]
+        if failure_probability > 0:
+            outcomes.append((np.full(model.num_states, 4), failure_probability))
+
+        rows, cols, chances = [], [], []
+        can_finish = np.zeros(model.num_states, dtype=bool)
+        for actions, chance in outcomes:
+            finished = model.finished[states, actions]
+            can_finish |= finished
+            rows.append(states[~finished])
+            cols.append(model.next_state[states, actions][~finished])
+            chances.append(np.full(np.sum(~finished), chance))
+        moves = sparse.csr_matrix((np.concatenate(chances),
+                                   (np.concatenate(rows),
+                                    np.concatenate(cols))),
+                                  shape=(model.num_states, model.num_states))
+        backward = moves.T.tocsr()
+
+        start_states = self.learner.indexer.start_states()
+        reachable = self.closure(moves, start_states)
+        leads_to_finish = self.closure(backward, states[can_finish])
+        stuck = reachable & ~leads_to_finish
+        infinite = self.closure(backward, states[stuck]) & reachable
+        finite = states[reachable & ~infinite]
+
+        # Solve (I - P) T = 1 over the states that always finish
+        expected = np.full(model.num_states, np.inf)
+        if len(finite) > 0:
+            inner = moves[finite][:, finite]
+            system = sparse.identity(len(finite), format='csc') - inner.tocsc()
+            expected[finite] = np.atleast_1d(spsolve(system,
+                                                     np.ones(len(finite))))
+
+        return {'starts': self.starts,
+                'expected_steps': expected[start_states],
+                'finishes': np.isfinite(expected[start_states])}
+
+    def closure(self, moves, seeds):
+        '''
+        This method finds the states that can be reached from some states
+
+        INPUT:
+            moves(scipy.sparse.csr_matrix): Nonzero where a state can move to
+                                            another state
+            seeds(ndarray): Indices of the states to start from
+        OUTPUT:
+            ndarray: True for the states that can be reached, including the
+                     states started from
+        '''
+        reached = np.zeros(moves.shape[0], dtype=bool)
+        reached[seeds] = True
+        frontier = np.flatnonzero(reached)
+        while len(frontier) > 0:
+            frontier = np.unique(moves[frontier].indices)
+            frontier = frontier[~reached[frontier]]
+            reached[frontier] = True
+
+        return reached
+
+def evaluate_exact(learner, crash_type, failure_probability=0.0):
+    '''
+    This function finds the expected number of steps to the finish line from
+    each start point with the policy of a trained model
+
+    INPUT:
+        learner(Helper): A trained model
+        crash_type(int): 0 for mild crash and 1 for harsh crash
+        failure_probability(float): Chance that an attempt to accelerate fails
+    OUTPUT:
+        dict: Output of "PolicyEvaluator.exact"
+    '''
+    evaluator = PolicyEvaluator(learner, crash_type)
+
+    return evaluator.exact(failure_probability)
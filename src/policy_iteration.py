@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+'''
+This class implements a Policy Iteration model used for reinforcement learning.
+The model trains a race car to learn to get from the starting line to the
+finish line in a minimum amount of time
+'''
+
+from racetrack import Racetrack
+from agent import Agent
+from helper import Helper
+from transition_model import TransitionModel
+import numpy as np
+import time
+
+class PolicyIteration(Helper):
+    tables = ['q_table', 'v_table', 'p_table', 'actions'] # Saved by "save"
+
+    def __init__(self, file, reachable_only=False, swept_path=False):
+        racetrack = Racetrack(file, swept_path)
+        Helper.__init__(self, racetrack, reachable_only)
+        self.accelerations = np.array([[-1,-1], [-1,0], [-1,1], [0,-1], [0,0],
+                                       [0,1], [1,-1], [1,0], [1,1]])
+        self.iterations = 0 # Number of training iterations
+        self.past_policy_changes = [] # Policy changes of each iteration
+        self.actions = np.full(self.indexer.num_states, 4) # Index of [0, 0]
+        self.q_table = np.zeros((self.indexer.num_states,
+                                 len(self.accelerations)))
+        self.v_table = np.zeros(self.indexer.num_states)
+        self.p_table = self.accelerations[self.actions]
+
+    def train(self, iterations, crash_type, evaluation='exact',
+              init_from=None, callback=None):
+        '''
+        This method trains the model
+
+        INPUT:
+            iterations(int): Maximum number of training iterations allowed
+            crash_type(int): 0 for mild crash and 1 for harsh crash
+            evaluation(str): "exact" to find the values of the policy exactly,
+                             "iterative" to approximate them by iterations
+            init_from(Helper or str): Earlier solution to start from, as a
+                                      model or a path saved by "save"
+            callback(function): Called with a dict of measurements after
+                                each training iteration, such as
+                                "TrainingMetrics"
+        OUTPUT:
+            list: Number of states whose policy changed in each iteration
+        '''
+        discount = 0.95
+        self.crash_type = crash_type
+        self.hyperparameters = {'discount': discount, 'evaluation': evaluation}
+        model = TransitionModel(self.track, crash_type, self.indexer)
+        if init_from is not None:
+            self.warm_start(init_from)
+        if evaluation == 'exact':
+            evaluate = self.evaluate_exact
+        else:
+            evaluate = self.evaluate_iterative
+
+        # Keep training until the policy stops changing, or maximum iterations
+        # are used
+        is_converged = False
+        while (not is_converged) and (self.iterations < iterations):
+            if callback is not None:
+                start = time.perf_counter()
+            self.v_table = evaluate(model, discount)
+            if callback is not None:
+                evaluated = time.perf_counter()
+            policy_changes = self.improve(model, discount)
+
+            # Bellman residual of the values of the evaluated policy
+            if callback is not None:
+                improved = time.perf_counter()
+                residual = np.max(np.abs(np.max(self.q_table, axis=1)
+                                         - self.v_table))
+                callback({'model': 'PolicyIteration',
+                          'crash_type': crash_type,
+                          'iteration': self.iterations + 1,
+                          'seconds': improved - start,
+                          'evaluation_seconds': evaluated - start,
+                          'improvement_seconds': improved - evaluated,
+                          'backups': model.num_states,
+                          'residual': float(residual),
+                          'policy_changes': policy_changes})
+
+            # For demonstration purpose
+            print('Iteration:', self.iterations + 1)
+            print('Policy changes:', policy_changes)
+
+            # Convergence criteria
+            if policy_changes == 0:
+                is_converged = True
+
+            self.past_policy_changes.append(policy_changes)
+            self.iterations += 1
+
+        return self.past_policy_changes
+
+    def evaluate_exact(self, model, discount):
+        '''
+        This method finds the value of each state under the current policy.
+        The dynamics are deterministic, so the value of a state is the
+        discounted sum of rewards along a single path. Paths of 2, 4, 8, ...
+        steps are combined until the remaining steps no longer count
+
+        INPUT:
+            model(TransitionModel): Transitions of the racetrack
+            discount(float): Discount factor
+        OUTPUT:
+            ndarray: Value of each state
+        '''
+        states = np.arange(model.num_states)
+        finished = model.finished[states, self.actions]
+
+        # Passing the finish line leads to an extra state that stays put
+        # without reward
+        end = model.num_states
+        next_state = np.append(np.where(finished, end,
+                                        model.next_state[states, self.actions]),
+                               end)
+        value = np.append(np.where(finished, 0.0, -1.0), 0.0)
+
+        factor = discount
+        while factor > np.finfo(float).eps:
+            value = value + factor * value[next_state]
+            next_state = next_state[next_state]
+            factor *= factor
+
+        return value[:-1]
+
+    def evaluate_iterative(self, model, discount, threshold=0.001):
+        '''
+        This method approximates the value of each state under the current
+        policy, starting from the current value table
+
+        INPUT:
+            model(TransitionModel): Transitions of the racetrack
+            discount(float): Discount factor
+            threshold(float): Maximum value difference at convergence
+        OUTPUT:
+            ndarray: Value of each state
+        '''
+        states = np.arange(model.num_states)
+        finished = model.finished[states, self.actions]
+        next_state = model.next_state[states, self.actions]
+
+        value = self.v_table
+        max_delta = threshold
+        while max_delta >= threshold:
+            new_value = np.where(finished, 0.0, -1 + discount*value[next_state])
+            max_delta = np.max(np.abs(new_value - value))
+            value = new_value
+
+        return value
+
+    def improve(self, model, discount):
+        '''
+        This method makes the policy greedy with respect to the value table. An
+        action is only replaced by a strictly better one, so that the policy
+        stops changing once it is optimal
+
+        INPUT:
+            model(TransitionModel): Transitions of the racetrack
+            discount(float): Discount factor
+        OUTPUT:
+            int: Number of states whose policy changed
+        '''
+        states = np.arange(model.num_states)
+        self.q_table = np.where(model.finished, 0.0,
+                                -1 + discount*self.v_table[model.next_state])
+        best = np.argmax(self.q_table, axis=1)
+        is_better = (self.q_table[states, best] >
+                     self.q_table[states, self.actions])
+
+        self.actions = np.where(is_better, best, self.actions)
+        self.p_table = self.accelerations[self.actions]
+
+        return int(np.sum(is_better))
+
+    def test(self, crash_type, write_to_file=False):
+        '''
+        This method simulates a race of a test car using the trained model
+
+        INPUT:
+            crash_type(int): 0 for mild crash and 1 for harsh crash
+            write_to_file(boolean): True if the process is printed to console,
+                                    False if the process is written to file
+        OUTPUT:
+            int: Number of steps needed for the test car to reach the goal
+        '''
+        car = self.initialize_car(crash_type)
+        self.iter = 0
+        self.record.append(0, car.position, car.velocity)
+
+        # Allow the test car to run on the racetrack until it reaches the goal
+        finish = False
+        while not finish:
+            # For demonstration purpose
+            if not write_to_file:
+                self.print_one(car)
+
+            # Find the policy for current state
+            state = self.indexer.state_index(car.position, car.velocity)
+            acceleration = self.p_table[state].tolist()
+
+            # Accelerate and move to the next state
+            car.update_velocity(acceleration)
+            finish = self.act(car, self.actions[state])
+
+        # For demonstration purpose
+        if not write_to_file:
+            self.print_last(car)
+            print()
+            self.print_all()
+
+        return self.iter
+
+def main():
+    print()
+    file = input('Specify the racetrack to be used: ')
+    iterations = 1000
+
+    for crash_type in ([0, 1]):
+        if crash_type == 0:
+            crash = 'Mild Crash'
+        else:
+            crash = 'Harsh Crash'
+        print()
+        _ = input('Press enter to start training a Policy Iteration model with '
+                  + crash + ': ')
+        print()
+        print('Training process')
+        print('----------------')
+
+        policy_iter = PolicyIteration(file)
+        learning_curve = policy_iter.train(iterations, crash_type)
+
+        print()
+        print('--> Training completed')
+        print()
+        _ = input('Press enter to start testing: ')
+
+        steps = policy_iter.test(crash_type)
+        steps += 1
+
+        print('---------------------------------------------------------')
+        print('Steps needed for the test car to reach the finish line:', steps)
+
+    print()
+
+if __name__ == '__main__':
+	main()
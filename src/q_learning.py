@@ -9,19 +9,26 @@ finish line in a minimum amount of time
 from racetrack import Racetrack
 from agent import Agent
 from helper import Helper
+from transition_model import TransitionModel
 import numpy as np
 import random
 import copy
+import time
 
 class QLearning(Helper):
-    def __init__(self, file):
-        racetrack = Racetrack(file)
-        Helper.__init__(self, racetrack)
-        self.q_table = self.initialize_q(len(self.track.track),
-                                         len(self.track.track[0]))
+    tables = ['q_table'] # Tables saved by "save"
+
+    def __init__(self, file, reachable_only=False, dtype=np.float64,
+                 swept_path=False):
+        racetrack = Racetrack(file, swept_path)
+        Helper.__init__(self, racetrack, reachable_only)
+        self.accelerations = [[-1,-1], [-1,0], [-1,1], [0,-1], [0,0], [0,1], \
+                              [1,-1], [1,0], [1,1]] # List of possible actions
+        self.q_table = self.initialize_q(self.indexer.num_states, dtype)
         self.num_steps = [] # Number of steps taken in each training iteration
 
-    def train(self, iterations, crash_type, steps):
+    def train(self, iterations, crash_type, steps, vectorized=False,
+              num_cars=100, init_from=None, callback=None):
         '''
         This method trains the model
 
@@ -29,64 +36,100 @@ class QLearning(Helper):
             iterations(int): Number of training iterations
             crash_type(int): 0 for mild crash and 1 for harsh crash
             steps(int): Maximum number of training steps in each iteration
+            vectorized(boolean): True to train many cars at once
+            num_cars(int): Number of cars trained at once if vectorized
+            init_from(Helper or str): Earlier solution to start from, as a
+                                      model or a path saved by "save"
+            callback(function): Called with a dict of measurements after
+                                each training iteration, such as
+                                "TrainingMetrics"
         OUTPUT:
             list: Numbers of steps needed to reach the goal in all iterations
         '''
+        if init_from is not None:
+            self.warm_start(init_from)
+        if vectorized:
+            return self.train_vectorized(iterations, crash_type, steps,
+                                         num_cars, callback)
+
         reward = -1
         discount = 0.95
         max_delta_q = 0
         epsilon = 0.5
         learning_rate = 0.75
         decay = 0.9999
+        self.crash_type = crash_type
+        self.hyperparameters = {'discount': discount, 'epsilon': epsilon,
+                                'learning_rate': learning_rate, 'decay': decay,
+                                'steps': steps}
+
+        model = TransitionModel(self.track, crash_type, self.indexer)
+        next_states = model.next_state.tolist()
+        finished = model.finished.tolist()
+        if callback is not None:
+            crashed = model.crashed.tolist()
+        q_table = self.q_table
 
         # Train through the specified number of training iterations
         for iteration in range(iterations):
             car = self.initialize_car(crash_type)
-
-            # [i][j][k][l] is the state of the car
-            i = car.position[0]
-            j = car.position[1]
-            k = car.velocity[0] + 5
-            l = car.velocity[1] + 5
+            state = self.indexer.state_index(car.position, car.velocity)
+            if callback is not None:
+                start = time.perf_counter()
+                crashes = 0
+                residual = 0
+                policy_changes = 0
 
             # Keep training until reaching the finish line, or the maximum
             # number of steps are taken
             step = 0
             finish = False
             while (not finish) and (step < steps):
-                q_values = self.q_table[i][j][k][l]
-                acceleration_index = self.epsilon_greedy_policy(q_values,
-                                                                epsilon)
+                q_values = q_table[state]
+                action = self.epsilon_greedy_policy(q_values, epsilon)
 
                 # 20% of the time, the attempt to accelerate would fail
-                q_value = q_values[1][1]
-                acceleration = [0, 0]
+                q_value = q_values[4]
+                applied_action = 4 # Index of acceleration [0, 0]
                 if random.random() < 0.8:
-                    q_value = q_values[acceleration_index[0]] \
-                                      [acceleration_index[1]]
-                    acceleration = [acceleration_index[0] - 1, \
-                                    acceleration_index[1] - 1]
-
-                # Update position and velocity. Check if the goal is reached
-                car.update_velocity(acceleration)
-                has_finished = car.update_position()
+                    q_value = q_values[action]
+                    applied_action = action
+
+                # Look up the next state. Check if the goal is reached
+                has_finished = finished[state][applied_action]
                 if has_finished:
                     finish = True
                 else:
-                    i = car.position[0]
-                    j = car.position[1]
-                    k = car.velocity[0] + 5
-                    l = car.velocity[1] + 5
-
                     # Update the Q table for the current state-action pair
-                    q_values_prime = self.q_table[i][j][k][l]
-                    max_q_value_prime = np.max(q_values_prime)
-                    q_values[acceleration_index[0]][acceleration_index[1]] += (
+                    next_state = next_states[state][applied_action]
+                    max_q_value_prime = q_table[next_state].max()
+                    if callback is not None:
+                        best = q_values.argmax()
+                        crashes += crashed[state][applied_action]
+                        residual = max(residual, abs(
+                            reward + discount * max_q_value_prime - q_value))
+                    q_table[state, action] += (
                         learning_rate * (reward + discount * max_q_value_prime
                         - q_value))
+                    if callback is not None:
+                        policy_changes += int(q_values.argmax() != best)
+                    state = next_state
 
                 step += 1
 
+            if callback is not None:
+                callback({'model': 'QLearning',
+                          'crash_type': crash_type,
+                          'iteration': len(self.num_steps) + 1,
+                          'seconds': time.perf_counter() - start,
+                          'steps': step,
+                          'crashes': crashes,
+                          'finishes': int(finish),
+                          'epsilon': epsilon,
+                          'learning_rate': learning_rate,
+                          'residual': float(residual),
+                          'policy_changes': policy_changes})
+
             # Gradually reduce epsilon and learning rate through the process
             epsilon *= decay
             if learning_rate > 0.01:
@@ -96,6 +139,139 @@ class QLearning(Helper):
 
         return self.num_steps
 
+    def train_vectorized(self, iterations, crash_type, steps, num_cars,
+                         callback=None):
+        '''
+        This method trains the model with many cars at once. Each car runs its
+        own training iteration, and a new iteration starts as soon as a car
+        finishes or runs out of steps. In each step, every car reads the Q
+        table as it was before the step. If several cars update the same
+        state-action pair in one step, the pair is updated once by the average
+        of their updates. A failed attempt to accelerate is treated as part of
+        the racetrack, so the chosen action is updated from its own Q value
+
+        INPUT:
+            iterations(int): Number of training iterations
+            crash_type(int): 0 for mild crash and 1 for harsh crash
+            steps(int): Maximum number of training steps in each iteration
+            num_cars(int): Number of cars trained at once
+            callback(function): Called with a dict of measurements each time
+                                a car finishes a training iteration
+        OUTPUT:
+            list: Numbers of steps needed to reach the goal in all iterations
+        '''
+        reward = -1
+        discount = 0.95
+        epsilon = 0.5
+        learning_rate = 0.75
+        decay = 0.9999
+        self.crash_type = crash_type
+        self.hyperparameters = {'discount': discount, 'epsilon': epsilon,
+                                'learning_rate': learning_rate, 'decay': decay,
+                                'steps': steps, 'num_cars': num_cars}
+
+        # No car is started without training iterations, as in "train"
+        if iterations <= 0:
+            return self.num_steps
+
+        model = TransitionModel(self.track, crash_type, self.indexer)
+        num_actions = len(self.accelerations)
+        starts = self.indexer.start_states()
+        q_table = self.q_table
+        q_flat = q_table.reshape(-1)
+
+        # [position, velocity] of each car as a state index
+        num_cars = max(1, min(num_cars, iterations))
+        states = starts[np.random.randint(len(starts), size=num_cars)]
+        car_steps = np.zeros(num_cars, dtype=int)
+        active = np.ones(num_cars, dtype=bool)
+        started = num_cars # Number of training iterations started
+        if callback is not None:
+            car_start = np.full(num_cars, time.perf_counter())
+            car_crashes = np.zeros(num_cars, dtype=int)
+            car_residual = np.zeros(num_cars)
+            car_changes = np.zeros(num_cars, dtype=int)
+
+        while active.any():
+            cars = np.flatnonzero(active)
+            car_states = states[cars]
+            q_values = q_table[car_states]
+
+            # Epsilon-greedy actions
+            actions = q_values.argmax(axis=1)
+            if callback is not None:
+                best = actions.copy()
+            explore = np.random.random(len(cars)) < epsilon
+            actions[explore] = np.random.randint(num_actions,
+                                                 size=np.sum(explore))
+
+            # 20% of the time, the attempt to accelerate would fail
+            applied_actions = np.where(np.random.random(len(cars)) < 0.8,
+                                       actions, 4)
+            q_value = q_values[np.arange(len(cars)), actions]
+            has_finished = model.finished[car_states, applied_actions]
+            next_states = model.next_state[car_states, applied_actions]
+
+            # Update the Q table for the state-action pairs of the cars that
+            # have not finished
+            moving = ~has_finished
+            max_q_value_prime = q_table[next_states[moving]].max(axis=1)
+            updates = learning_rate * (reward + discount * max_q_value_prime
+                                       - q_value[moving])
+            pairs = car_states[moving] * num_actions + actions[moving]
+            pairs, inverse = np.unique(pairs, return_inverse=True)
+            totals = np.bincount(inverse, weights=updates)
+            counts = np.bincount(inverse)
+            q_flat[pairs] += (totals / counts).astype(q_table.dtype)
+
+            if callback is not None:
+                movers = cars[moving]
+                car_crashes[movers] += model.crashed[car_states[moving],
+                                                     applied_actions[moving]]
+                car_residual[movers] = np.maximum(car_residual[movers],
+                                                  np.abs(updates)
+                                                  / learning_rate)
+                car_changes[movers] += (q_table[car_states[moving]].argmax(
+                                        axis=1) != best[moving])
+
+            states[cars] = np.where(moving, next_states, car_states)
+            car_steps[cars] += 1
+
+            # Start a new training iteration for each car that has finished
+            for car in cars[has_finished | (car_steps[cars] >= steps)]:
+                self.num_steps.append(int(car_steps[car]))
+                if callback is not None:
+                    now = time.perf_counter()
+                    callback({'model': 'QLearning',
+                              'crash_type': crash_type,
+                              'iteration': len(self.num_steps),
+                              'seconds': float(now - car_start[car]),
+                              'steps': int(car_steps[car]),
+                              'crashes': int(car_crashes[car]),
+                              'finishes': int(has_finished[cars == car][0]),
+                              'epsilon': epsilon,
+                              'learning_rate': learning_rate,
+                              'residual': float(car_residual[car]),
+                              'policy_changes': int(car_changes[car])})
+                    car_start[car] = now
+                    car_crashes[car] = 0
+                    car_residual[car] = 0
+                    car_changes[car] = 0
+
+                # Gradually reduce epsilon and learning rate
+                epsilon *= decay
+                if learning_rate > 0.01:
+                    learning_rate *= decay
+
+                if started < iterations:
+                    states[car] = starts[np.random.randint(len(starts))]
+                    car_steps[car] = 0
+                    started += 1
+                else:
+                    active[car] = False
+
+        return self.num_steps
+
     def test(self, crash_type, write_to_file=False):
         '''
         This method simulates a race of a test car using the trained model
@@ -109,7 +285,7 @@ class QLearning(Helper):
         '''
         car = self.initialize_car(crash_type)
         self.iter = 0
-        self.record.append(car.position)
+        self.record.append(0, car.position, car.velocity)
         epsilon = 0 # Only do exploitation during testing
 
         # Allow the test car to run on the racetrack until it reaches the goal,
@@ -121,17 +297,14 @@ class QLearning(Helper):
                 self.print_one(car)
 
             # Find the policy for current state
-            i = car.position[0]
-            j = car.position[1]
-            k = car.velocity[0] + 5
-            l = car.velocity[1] + 5
-            q_values = self.q_table[i][j][k][l]
-            acceleration_index = self.epsilon_greedy_policy(q_values, epsilon)
-            acceleration = [acceleration_index[0]-1, acceleration_index[1]-1]
+            state = self.indexer.state_index(car.position, car.velocity)
+            q_values = self.q_table[state]
+            action = self.epsilon_greedy_policy(q_values, epsilon)
+            acceleration = self.accelerations[action]
 
             # Accelerate and move to the next state
             car.update_velocity(acceleration)
-            finish = self.act(car)
+            finish = self.act(car, action)
 
         # For demonstration purpose
         if not write_to_file:
@@ -146,45 +319,33 @@ class QLearning(Helper):
         This method uses the epsilon-greedy policy to choose an action
 
         INPUT:
-            q_values(list): Q values of all possible actions
+            q_values(ndarray): Q values of all possible actions
             epsilon(float): Probability of doing exploration
         OUTPUT:
             int: Index of the chosen action
         '''
         if np.random.random() < epsilon:
             # Explore
-            acceleration_index = (np.random.randint(3), np.random.randint(3))
+            action = np.random.randint(len(q_values))
         else:
             # Exploit
-            acceleration_index = np.unravel_index(q_values.argmax(),
-                                                  q_values.shape)
+            action = int(q_values.argmax())
 
-        return acceleration_index
+        return action
 
-    def initialize_q(self, x_size, y_size):
+    def initialize_q(self, num_states, dtype=np.float64):
         '''
-        This method initializes the Q table
+        This method initializes the Q table as one array with a row of Q values
+        for each state
 
         INPUT:
-            x_size(int): The width of the racetrack
-            y_size(int): The height of the racetrack
+            num_states(int): Number of states the car can be in
+            dtype(type): Floating point type of the Q values
         '''
-        q_table = []
-        for i in range(x_size):
-            x_position = []
-            for j in range(y_size):
-                y_position = []
-                for k in range(-5, 6):
-                    x_velocity = []
-                    for l in range(-5, 6):
-                        default = np.random.rand(3, 3)
-                        default *= -1
-                        x_velocity.append(default)
-                    y_position.append(x_velocity)
-                x_position.append(y_position)
-            q_table.append(x_position)
-
-        return q_table
+        q_table = np.random.rand(num_states, len(self.accelerations))
+        q_table *= -1
+
+        return q_table.astype(dtype, copy=False)
 
 def main():
     print()
@@ -6,35 +6,53 @@ This class stores the information about a racetrack on which the race car runs
 
 import numpy as np
 
+# Codes of the types of points in the racetrack
+WALL = 0
+TRACK = 1
+START = 2
+FINISH = 3
+CELL_CODES = {'#': WALL, '.': TRACK, 'S': START, 'F': FINISH}
+
+# Codes of what a car runs into along its path in one step
+PATH_CLEAR = 0
+PATH_FINISH = 1
+PATH_WALL = 2
+
 class Racetrack():
-    def __init__(self, file):
+    def __init__(self, file, swept_path=False):
         self.file = file # Name of the racetrack file
+        self.swept_path = swept_path # True to check the whole path of a move
 
-        # Stores the racetrack in a 2D list and remove the first line
-        self.track = []
-        for line in open(file):
-            line = line.rstrip()
-            lst = list(line)
-            self.track.append(lst)
-        self.track = self.track[1:]
-
-        self.start_locations = []  # Stores all start points
-        self.finish_locations = [] # Stores all finish points
-        self.track_locations = []  # Stores all track points
-        self.wall_locations = []   # Stores all wall points
+        self.track = read_track(file) # Racetrack as a 2D list of characters
+
+        # Stores the type of each point in an array surrounded by a border of
+        # wall points, so that points just outside the racetrack are walls
+        rows = len(self.track)
+        cols = max([len(row) for row in self.track] + [0])
+        self.grid = np.full((rows + 2, cols + 2), WALL, dtype=np.uint8)
         for i, row in enumerate(self.track):
-            for j, val in enumerate(row):
-                if val == 'S':
-                    self.start_locations.append((i, j))
-                elif val == 'F':
-                    self.finish_locations.append((i, j))
-                elif val == '.':
-                    self.track_locations.append((i, j))
-                elif val == '#':
-                    self.wall_locations.append((i, j))
+            codes = [CELL_CODES.get(val, WALL) for val in row]
+            self.grid[i + 1, 1:len(row) + 1] = codes
+
+        cells = self.grid[1:-1, 1:-1]
+        self.start_locations = self.find_locations(cells == START)
+        self.finish_locations = self.find_locations(cells == FINISH)
+        self.track_locations = self.find_locations(cells == TRACK)
+        self.wall_locations = self.find_locations(cells == WALL)
 
         self.finish_line = self.draw_finish_line() # Position of finish line
 
+        # Index of the nearest track point and the nearest start point of each
+        # point in the racetrack, used to reset the car after a crash
+        self.nearest_track = self.find_nearest(self.track_locations)
+        self.nearest_start = self.find_nearest(self.start_locations)
+
+        # What a car runs into when it moves from each point the car can be
+        # located at with each velocity
+        self.path_table = None
+        if swept_path:
+            self.path_table = self.build_path_table()
+
     def get_nearest_track(self, position):
         '''
         This method finds a nearest track point to a point in the racetrack
@@ -44,6 +62,10 @@ class Racetrack():
         OUTPUT:
             tuple: Coordinates of the nearest track point
         '''
+        if self.is_inside(position):
+            return self.track_locations[self.nearest_track[position[0],
+                                                           position[1]]]
+
         position = np.array(position)
         track_locations = np.array(self.track_locations)
         distance = np.sum(np.square(track_locations - position), axis=1)
@@ -61,6 +83,10 @@ class Racetrack():
         OUTPUT:
             tuple: Coordinates of the nearest start point
         '''
+        if self.is_inside(position):
+            return self.start_locations[self.nearest_start[position[0],
+                                                           position[1]]]
+
         position = np.array(position)
         start_locations = np.array(self.start_locations)
         distance = np.sum(np.square(start_locations - position), axis=1)
@@ -69,24 +95,234 @@ class Racetrack():
 
         return nearest_start
 
+    def is_inside(self, position):
+        '''
+        This method determines whether a point is inside the racetrack
+
+        INPUT:
+            position(tuple): Coordinates of a specific point
+        OUTPUT:
+            boolean: True if the point is inside the racetrack
+        '''
+        return (0 <= position[0] < self.grid.shape[0] - 2 and
+                0 <= position[1] < self.grid.shape[1] - 2)
+
+    def find_nearest(self, locations):
+        '''
+        This method finds the nearest of some points to every point in the
+        racetrack, by squared Euclidean distance. Ties are broken the same way
+        as "np.argmin" over "locations", which are in the order of the rows.
+        The nearest point in each row is found first, then the nearest row,
+        both in time linear in the size of the racetrack
+
+        INPUT:
+            locations(list): Coordinates of the points, in the order of the
+                             racetrack rows
+        OUTPUT:
+            ndarray: Index in "locations" of the nearest point to each point,
+                     -1 if there are no points
+        '''
+        rows, cols = self.grid.shape[0] - 2, self.grid.shape[1] - 2
+        nearest = np.full((rows, cols), -1, dtype=int)
+        if len(locations) == 0:
+            return nearest
+
+        points = np.array(locations, dtype=int)
+        index = np.full((rows, cols), -1, dtype=int)
+        index[points[:, 0], points[:, 1]] = np.arange(len(points))
+        is_point = index >= 0
+
+        # Nearest point of the same row on each side of each column. The left
+        # one wins a tie since it comes first in "locations"
+        far = rows + cols
+        columns = np.arange(cols)
+        left = np.maximum.accumulate(np.where(is_point, columns, -far), axis=1)
+        right = np.minimum.accumulate(np.where(is_point, columns,
+                                               2 * far)[:, ::-1],
+                                      axis=1)[:, ::-1]
+        left_distance = columns - left
+        right_distance = right - columns
+        row_column = np.where(left_distance <= right_distance, left, right)
+        row_distance = np.square(np.minimum(left_distance, right_distance))
+        row_distance[~is_point.any(axis=1)] = 16 * far * far
+
+        # Nearest row for each point, from the lower envelope of the
+        # parabolas (i - r)^2 + row_distance[r] of the rows r of each column,
+        # built for all columns at once. "envelope" holds the rows of the
+        # parabolas of the envelope, and parabola k is lowest from boundary
+        # k to boundary k + 1. Boundaries are exact fractions, so that the
+        # first row wins a tie
+        height = row_distance + np.square(np.arange(rows))[:, None]
+        envelope = np.zeros((rows, cols), dtype=int)
+        bound_num = np.zeros((rows + 1, cols), dtype=np.int64)
+        bound_den = np.ones((rows + 1, cols), dtype=np.int64)
+        bound_num[0] = -16 * far * far * far
+        bound_num[1] = 16 * far * far * far
+        top = np.zeros(cols, dtype=int) # Last parabola of each envelope
+        for q in range(1, rows):
+            # Remove the parabolas that row q is lower than everywhere they
+            # are lowest
+            todo = columns
+            while len(todo) > 0:
+                k = top[todo]
+                row = envelope[k, todo]
+                num = height[q, todo] - height[row, todo]
+                den = 2 * (q - row)
+                is_hidden = num * bound_den[k, todo] <= bound_num[k, todo] * den
+                done = ~is_hidden
+                done_columns, k = todo[done], k[done] + 1
+                envelope[k, done_columns] = q
+                bound_num[k, done_columns] = num[done]
+                bound_den[k, done_columns] = den[done]
+                bound_num[k + 1, done_columns] = 16 * far * far * far
+                bound_den[k + 1, done_columns] = 1
+                top[done_columns] = k
+                todo = todo[is_hidden]
+                top[todo] -= 1
+
+        k = np.zeros(cols, dtype=int)
+        for i in range(rows):
+            todo = columns
+            while len(todo) > 0:
+                is_past = (bound_num[k[todo] + 1, todo] <
+                           i * bound_den[k[todo] + 1, todo])
+                todo = todo[is_past]
+                k[todo] += 1
+            best_row = envelope[k, columns]
+            nearest[i] = index[best_row, row_column[best_row, columns]]
+
+        return nearest
+
+    def find_locations(self, mask):
+        '''
+        This method lists the coordinates of points in the order of the rows
+
+        INPUT:
+            mask(ndarray): True for the points to be listed
+        OUTPUT:
+            list: Coordinates of the points as tuples
+        '''
+        return [tuple(point) for point in np.argwhere(mask).tolist()]
+
+    def cell_type(self, positions):
+        '''
+        This method finds the type of points in the racetrack. Points outside
+        of the racetrack are wall points
+
+        INPUT:
+            positions(ndarray): Coordinates of points in the last axis
+        OUTPUT:
+            ndarray: Code of the type of each point (WALL, TRACK, START or
+                     FINISH)
+        '''
+        positions = np.asarray(positions)
+        x = np.clip(positions[..., 0] + 1, 0, self.grid.shape[0] - 1)
+        y = np.clip(positions[..., 1] + 1, 0, self.grid.shape[1] - 1)
+
+        return self.grid[x, y]
+
     def is_wall(self, position):
         '''
         This method determines whether a point is a wall point or not
 
         INPUT:
-            position(tuple): Coordinates of a specific point
+            position(tuple): Coordinates of a specific point, or an array of
+                             coordinates in the last axis
         OUTPUT:
-            boolean: True if the point is a wall point, False otherwise
+            boolean: True if the point is a wall point, False otherwise. An
+                     array of booleans if an array of points is given
         '''
-        if (position[0] > (len(self.track) - 1) or
-            position[1] > (len(self.track[0]) - 1)):
-            return True
-        elif self.track[position[0]][position[1]] == '#':
-            return True
-        elif position[0] < 0 or position[1] < 0:
-            return True
+        is_wall = self.cell_type(position) == WALL
+        if is_wall.ndim == 0:
+            return bool(is_wall)
+
+        return is_wall
 
-        return False
+    def path_offsets(self, velocity):
+        '''
+        This method lists the points a car passes through when it moves with a
+        velocity, relative to its current position. When the path goes
+        exactly through the corner of a point, both neighbouring points are
+        counted as passed
+
+        INPUT:
+            velocity(list): Velocity of the car
+        OUTPUT:
+            list: Offsets of the points passed, in order, ending with the
+                  velocity itself
+        '''
+        x_steps, y_steps = abs(velocity[0]), abs(velocity[1])
+        x_sign, y_sign = int(np.sign(velocity[0])), int(np.sign(velocity[1]))
+        x, y = 0, 0
+        x_step, y_step = 0, 0
+        offsets = []
+        while x_step < x_steps or y_step < y_steps:
+            # Compare when the path crosses the next x and y boundaries
+            decision = (1 + 2*x_step)*y_steps - (1 + 2*y_step)*x_steps
+            if decision == 0:
+                offsets.append((x + x_sign, y))
+                offsets.append((x, y + y_sign))
+                x += x_sign
+                y += y_sign
+                x_step += 1
+                y_step += 1
+            elif decision < 0:
+                x += x_sign
+                x_step += 1
+            else:
+                y += y_sign
+                y_step += 1
+            offsets.append((x, y))
+
+        return offsets
+
+    def build_path_table(self):
+        '''
+        This method finds what a car runs into first along its path, for every
+        point the car can be located at and every velocity. The path of a
+        velocity is the same from every point, so each velocity is checked
+        for all points at once
+
+        OUTPUT:
+            ndarray: PATH_CLEAR, PATH_FINISH or PATH_WALL for each point in
+                     "drivable_index" and each velocity + 5
+        '''
+        cells = np.argwhere(self.grid[1:-1, 1:-1] != WALL)
+        self.drivable_index = np.full((self.grid.shape[0] - 2,
+                                       self.grid.shape[1] - 2), -1, dtype=int)
+        self.drivable_index[cells[:, 0], cells[:, 1]] = np.arange(len(cells))
+
+        path_table = np.zeros((len(cells), 11, 11), dtype=np.uint8)
+        for x_velocity in range(-5, 6):
+            for y_velocity in range(-5, 6):
+                outcome = path_table[:, x_velocity + 5, y_velocity + 5]
+                moving = np.ones(len(cells), dtype=bool)
+                for offset in self.path_offsets([x_velocity, y_velocity]):
+                    cell_type = self.cell_type(cells + offset)
+                    finishes = moving & (cell_type == FINISH)
+                    crashes = moving & (cell_type == WALL)
+                    outcome[finishes] = PATH_FINISH
+                    outcome[crashes] = PATH_WALL
+                    moving &= ~(finishes | crashes)
+
+        return path_table
+
+    def path_outcome(self, positions, velocities):
+        '''
+        This method looks up what cars run into along their paths
+
+        INPUT:
+            positions(ndarray): Coordinates of the cars in the last axis
+            velocities(ndarray): Velocities of the cars in the last axis
+        OUTPUT:
+            ndarray: PATH_CLEAR, PATH_FINISH or PATH_WALL for each car
+        '''
+        positions = np.asarray(positions)
+        velocities = np.asarray(velocities)
+        cells = self.drivable_index[positions[..., 0], positions[..., 1]]
+
+        return self.path_table[cells, velocities[..., 0] + 5,
+                               velocities[..., 1] + 5]
 
     def draw_finish_line(self):
         '''
@@ -154,3 +390,21 @@ class Racetrack():
                 crossed = True
 
         return crossed
+
+def read_track(file):
+    '''
+    This function reads the points of a racetrack file, without finding
+    anything else a "Racetrack" needs
+
+    INPUT:
+        file(str): Name of the racetrack file
+    OUTPUT:
+        list: Racetrack as a 2D list of characters, without the first line
+    '''
+    track = []
+    with open(file) as in_file:
+        for line in in_file:
+            line = line.rstrip()
+            track.append(list(line))
+
+    return track[1:]
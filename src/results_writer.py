@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+'''
+This class writes the results of training and testing runs to a directory of
+compact files, appending to them as results come in:
+
+    curves.csv        run,iteration,value of the learning curves
+    trajectories.csv  run,test_run,step,row,col,vx,vy,action,crashed of the
+                      test runs
+    summary.jsonl     one line of information about each run
+    metrics.jsonl     records sent to the callbacks of the "train" methods,
+                      if any callback is made
+
+Learning curves and metrics can be downsampled. Rows are written in bulk
+through large file buffers. The text view of the test runs is a separate step
+done by "render_test_runs"
+'''
+
+from racetrack import read_track
+from trajectory import FIELDS
+import numpy as np
+import json
+import csv
+import os
+
+class ResultsWriter():
+    def __init__(self, directory, downsample=1, buffer_size=1 << 20,
+                 append=False):
+        self.directory = directory # Directory the files are written to
+        self.downsample = max(1, downsample) # Keep every n-th curve point
+        os.makedirs(directory, exist_ok=True)
+
+        self.buffer_size = buffer_size # Size of the buffer of each file
+        self.append = append # True to append to the files of an earlier run
+
+        # Open every file once and keep it open until "close". Files left by
+        # an earlier run are replaced unless appending. "metrics.jsonl" is
+        # only opened once a callback is made
+        self.files = {}
+        self.open_file('curves.csv', 'run,iteration,value\n')
+        self.open_file('trajectories.csv',
+                       'run,test_run,' + ','.join(FIELDS) + '\n')
+        self.open_file('summary.jsonl')
+
+    def open_file(self, name, header=None):
+        '''
+        This method opens one of the files of the directory
+
+        INPUT:
+            name(str): Name of the file
+            header(str): First line of a new file, if any
+        '''
+        path = os.path.join(self.directory, name)
+        is_new = not (self.append and os.path.exists(path))
+        self.files[name] = open(path, 'a' if self.append else 'w',
+                                buffering=self.buffer_size)
+        if header is not None and is_new:
+            self.files[name].write(header)
+
+    def keep(self, iteration, count):
+        '''
+        This method decides if a point of a learning curve is kept. The first
+        and the last points are always kept
+
+        INPUT:
+            iteration(int): Index of the point
+            count(int): Number of points, None if not known yet
+        OUTPUT:
+            boolean: True if the point is kept
+        '''
+        return (iteration % self.downsample == 0 or
+                (count is not None and iteration == count - 1))
+
+    def write_curve(self, run, learning_curve):
+        '''
+        This method writes the learning curve of a run
+
+        INPUT:
+            run(str): Name of the run
+            learning_curve(list): Value of each training iteration
+        '''
+        count = len(learning_curve)
+        self.files['curves.csv'].write(''.join(
+            run + ',' + str(i + 1) + ',' + str(learning_curve[i]) + '\n'
+            for i in range(count) if self.keep(i, count)))
+
+    def write_test_runs(self, run, trajectories):
+        '''
+        This method writes the steps of the test car in each test run
+
+        INPUT:
+            run(str): Name of the run
+            trajectories(list): Array of each test run, as
+                                "Trajectory.array"
+        '''
+        self.files['trajectories.csv'].write(''.join(
+            run + ',' + str(i + 1) + ',' + ','.join(map(str, step)) + '\n'
+            for i, trajectory in enumerate(trajectories)
+            for step in trajectory.tolist()))
+
+    def write_summary(self, run, summary):
+        '''
+        This method writes information about a run, such as the track, the
+        model and the average number of steps taken in the test runs
+
+        INPUT:
+            run(str): Name of the run
+            summary(dict): Information about the run
+        '''
+        record = {'run': run}
+        record.update(summary)
+        self.files['summary.jsonl'].write(json.dumps(record) + '\n')
+
+    def callback(self, run):
+        '''
+        This method makes a callback for the "train" methods which appends
+        every n-th record to "metrics.jsonl" while the model trains
+
+        INPUT:
+            run(str): Name of the run
+        OUTPUT:
+            function: The callback
+        '''
+        if 'metrics.jsonl' not in self.files:
+            self.open_file('metrics.jsonl')
+        out_file = self.files['metrics.jsonl']
+        count = [0]
+
+        def write_record(record):
+            if self.keep(count[0], None):
+                line = {'run': run}
+                line.update(record)
+                out_file.write(json.dumps(line) + '\n')
+            count[0] += 1
+
+        return write_record
+
+    def close(self):
+        '''
+        This method writes what is left in the buffers and closes the files
+        '''
+        for out_file in self.files.values():
+            out_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def render_trajectory(track, positions):
+    '''
+    This function draws the positions of a test car on a racetrack, each as
+    the number of the step it was taken at
+
+    INPUT:
+        track(list): Racetrack as a 2D list, as "Racetrack.track"
+        positions(ndarray): Row and column of the car at each step
+    OUTPUT:
+        str: The racetrack with the positions, as in "Helper.write_all"
+    '''
+    # Only the rows the car was on are copied. A later step at the same
+    # point is drawn over an earlier one
+    steps = {}
+    for i, position in enumerate(positions.tolist()):
+        steps[tuple(position)] = i
+    rows = {}
+    for (i, j), step in steps.items():
+        rows.setdefault(i, list(track[i]))[j] = step
+
+    lines = ['Car positions from all iterations\n',
+             '---------------------------------\n']
+    for i in range(len(track)):
+        lines.append(''.join(str(val) for val in rows.get(i, track[i])) + '\n')
+
+    return ''.join(lines)
+
+def render_test_runs(directory, run, track_file, out_file):
+    '''
+    This function writes the text view of the test runs of a run stored by
+    "ResultsWriter"
+
+    INPUT:
+        directory(str): Directory written by "ResultsWriter"
+        run(str): Name of the run
+        track_file(str): Racetrack file the run used
+        out_file(_io.TextIOWrapper): The output file being written to
+    '''
+    track = read_track(track_file)
+    trajectories = {}
+    with open(os.path.join(directory, 'trajectories.csv')) as in_file:
+        for row in csv.DictReader(in_file):
+            if row['run'] == run:
+                positions = trajectories.setdefault(int(row['test_run']), [])
+                positions.append((int(row['row']), int(row['col'])))
+
+    for test_run in sorted(trajectories):
+        out_file.write('\n')
+        out_file.write('Test run #' + str(test_run) + '\n')
+        out_file.write(render_trajectory(track,
+                                         np.array(trajectories[test_run])))
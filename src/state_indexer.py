@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+'''
+This class numbers the states of a race car on a racetrack. Only the points
+the car can be located at (track, start and finish points) are given states,
+so wall points take no room in the tables of the learners
+'''
+
+from racetrack import Racetrack
+import numpy as np
+
+class StateIndexer():
+    def __init__(self, track, locations=None):
+        self.track = track # A Racetrack object
+
+        # Points the car can be located at, in the order of the racetrack rows
+        if locations is None:
+            locations = sorted(track.start_locations + track.finish_locations +
+                               track.track_locations)
+        self.locations = np.array(locations, dtype=int).reshape(-1, 2)
+
+        # A state is [x position, y position, x velocity + 5, y velocity + 5]
+        velocities = np.array([[k, l] for k in range(11) for l in range(11)])
+        self.states = np.concatenate(
+            [np.repeat(self.locations, len(velocities), axis=0),
+             np.tile(velocities, (len(self.locations), 1))], axis=1)
+        self.num_states = len(self.states)
+
+        # Index of each state in the grid of all states, -1 for wall points.
+        # 32-bit indices halve the size of the grid on large racetracks
+        self.shape = (len(track.track), len(track.track[0]), 11, 11)
+        self.index = np.full(self.shape, -1, dtype=np.int32)
+        self.index[tuple(self.states.T)] = np.arange(self.num_states)
+
+        # Indices of the states in the indexer this one is restricted from
+        self.parent_index = np.arange(self.num_states)
+
+    def state_index(self, position, velocity):
+        '''
+        This method finds the index of a state
+
+        INPUT:
+            position(list): Coordinates of the car
+            velocity(list): Velocity of the car
+        OUTPUT:
+            int: Index of the state, -1 if the car cannot be at the position
+        '''
+        return int(self.index[position[0], position[1],
+                              velocity[0] + 5, velocity[1] + 5])
+
+    def get_state(self, index):
+        '''
+        This method finds the position and the velocity of a state
+
+        INPUT:
+            index(int): Index of the state
+        OUTPUT:
+            list: Coordinates of the car
+            list: Velocity of the car
+        '''
+        i, j, k, l = self.states[index].tolist()
+
+        return [i, j], [k - 5, l - 5]
+
+    def start_states(self):
+        '''
+        This method finds the states of a car standing on the starting line
+
+        OUTPUT:
+            ndarray: Indices of the start states
+        '''
+        starts = np.array(self.track.start_locations, dtype=int)
+
+        return self.index[starts[:, 0], starts[:, 1], 5, 5]
+
+    def find_reachable(self, models):
+        '''
+        This method finds the states a car can reach from the starting line
+
+        INPUT:
+            models(list): "TransitionModel" objects built on this indexer. A
+                          state is reachable if it is reachable in any of them
+        OUTPUT:
+            ndarray: True where the state is reachable
+        '''
+        reachable = np.zeros(self.num_states, dtype=bool)
+        frontier = self.start_states()
+        reachable[frontier] = True
+        while len(frontier) > 0:
+            next_states = []
+            for model in models:
+                moves = model.next_state[frontier][~model.finished[frontier]]
+                next_states.append(moves)
+            frontier = np.unique(np.concatenate(next_states))
+            frontier = frontier[~reachable[frontier]]
+            reachable[frontier] = True
+
+        return reachable
+
+    def restrict(self, keep):
+        '''
+        This method creates an indexer that only numbers some of the states
+
+        INPUT:
+            keep(ndarray): True where the state is kept
+        OUTPUT:
+            StateIndexer: The restricted indexer
+        '''
+        restricted = StateIndexer.__new__(StateIndexer)
+        restricted.track = self.track
+        restricted.locations = self.locations
+        restricted.states = self.states[keep]
+        restricted.num_states = len(restricted.states)
+        restricted.shape = self.shape
+        restricted.index = np.full(self.shape, -1, dtype=np.int32)
+        restricted.index[tuple(restricted.states.T)] = \
+                                             np.arange(restricted.num_states)
+        restricted.parent_index = self.parent_index[keep]
+
+        return restricted
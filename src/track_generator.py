@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+'''
+Run this module to write a synthetic racetrack of any size, to see how time
+and memory grow with the size of the racetrack. The racetrack is a corridor
+winding through vertical lanes, with the starting line at one end and the
+finish line at the other. The same seed always gives the same racetrack
+'''
+
+import argparse
+import random
+
+def generate_track(rows, cols, width=5, turns=4, start_side='top',
+                   reverse=False, seed=0):
+    '''
+    This function generates a racetrack. The corridor runs along a vertical
+    lane, turns twice to get into the next lane, and so on. With an odd
+    number of turns, it leaves the last lane to the right. The positions of
+    the lanes and of the turns are random
+
+    INPUT:
+        rows(int): Number of rows, including the walls around the racetrack
+        cols(int): Number of columns, including the walls around the racetrack
+        width(int): Width of the corridor, at least 2
+        turns(int): Number of 90 degree turns of the corridor
+        start_side(str): "top" or "bottom", where the first lane starts
+        reverse(boolean): True to swap the starting line and the finish line
+        seed(int): Random seed
+    OUTPUT:
+        list: Rows of the racetrack as strings of "#", ".", "S" and "F"
+    '''
+    if width < 2:
+        raise ValueError('The corridor must be at least 2 points wide')
+    if start_side not in ['top', 'bottom']:
+        raise ValueError('start_side must be "top" or "bottom"')
+
+    rng = random.Random(seed)
+    lanes = turns // 2 + 1
+    tail = turns % 2 == 1 # The corridor leaves the last lane to the right
+
+    # Columns left once the lanes, the walls between them and the end of the
+    # corridor after the last lane take their share
+    free = cols - 2 - lanes * width - (lanes - 1) - tail * width
+    if free < 0:
+        raise ValueError('Not enough columns for ' + str(turns) + ' turns '
+                         'of a corridor ' + str(width) + ' points wide')
+    if rows - 2 < 3 * width:
+        raise ValueError('Not enough rows for a corridor ' + str(width) +
+                         ' points wide')
+
+    # Share the free columns randomly between the wall before the first lane,
+    # the walls between the lanes and the wall after the last lane
+    weights = [rng.random() for _ in range(lanes + 1)]
+    extra = [int(free * weight / sum(weights)) for weight in weights]
+    lane_cols = []
+    col = 1 + extra[0]
+    for i in range(lanes):
+        lane_cols.append(col)
+        col += width + 1 + extra[i + 1]
+
+    # Each turn is a random number of rows away from the top or the bottom
+    # wall. The lanes go down and up in turn
+    max_depth = (rows - 2 - 3 * width) // 2
+    depths = [rng.randint(0, max_depth) for _ in range(turns + 2)]
+    going_down = start_side == 'top'
+    track = [['#'] * cols for _ in range(rows)]
+
+    def fill(top, bottom, left, right, val='.'):
+        for i in range(top, bottom):
+            for j in range(left, right):
+                track[i][j] = val
+
+    # Row span of each lane, from the end it is entered at to the end it is
+    # left at
+    spans = []
+    for i in range(lanes):
+        top = 1 + depths[i]
+        bottom = rows - 1 - depths[i + 1]
+        if not going_down:
+            top, bottom = 1 + depths[i + 1], rows - 1 - depths[i]
+        left = lane_cols[i]
+        fill(top, bottom, left, left + width)
+        spans.append((top, bottom, going_down))
+
+        # Turn into the next lane along the end the lane is left at
+        if i < lanes - 1:
+            right = lane_cols[i + 1] + width
+            if going_down:
+                fill(bottom - width, bottom, left, right)
+            else:
+                fill(top, top + width, left, right)
+        going_down = not going_down
+
+    # Starting line across the first lane at the end it is entered at
+    top, bottom, down = spans[0]
+    first_row = top if down else bottom - 1
+    first_line = [(first_row, j) for j in range(lane_cols[0],
+                                                lane_cols[0] + width)]
+
+    # Finish line across the last lane at the end it is left at, or across
+    # the end of the corridor leaving it
+    top, bottom, down = spans[-1]
+    left = lane_cols[-1]
+    if tail:
+        if down:
+            fill(bottom - width, bottom, left, cols - 1)
+            last_line = [(i, cols - 2) for i in range(bottom - width, bottom)]
+        else:
+            fill(top, top + width, left, cols - 1)
+            last_line = [(i, cols - 2) for i in range(top, top + width)]
+    else:
+        last_row = bottom - 1 if down else top
+        last_line = [(last_row, j) for j in range(left, left + width)]
+
+    if reverse:
+        first_line, last_line = last_line, first_line
+    for i, j in first_line:
+        track[i][j] = 'S'
+    for i, j in last_line:
+        track[i][j] = 'F'
+
+    return [''.join(row) for row in track]
+
+def write_track(file, rows, cols, width=5, turns=4, start_side='top',
+                reverse=False, seed=0):
+    '''
+    This function generates a racetrack and writes it to a racetrack file
+
+    INPUT:
+        file(str): Path of the racetrack file
+        Other inputs are the same as "generate_track"
+    OUTPUT:
+        str: Path of the racetrack file
+    '''
+    track = generate_track(rows, cols, width, turns, start_side, reverse, seed)
+    with open(file, 'w') as out_file:
+        out_file.write(str(rows) + ',' + str(cols) + '\n')
+        for row in track:
+            out_file.write(row + '\n')
+
+    return file
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic racetrack')
+    parser.add_argument('file', help='path of the racetrack file')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('cols', type=int)
+    parser.add_argument('--width', type=int, default=5,
+                        help='width of the corridor')
+    parser.add_argument('--turns', type=int, default=4,
+                        help='number of 90 degree turns')
+    parser.add_argument('--start-side', choices=['top', 'bottom'],
+                        default='top', help='where the first lane starts')
+    parser.add_argument('--reverse', action='store_true',
+                        help='swap the starting line and the finish line')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_track(args.file, args.rows, args.cols, args.width, args.turns,
+                args.start_side, args.reverse, args.seed)
+
+if __name__ == '__main__':
+    main()
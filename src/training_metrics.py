@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+'''
+This class collects the records a model passes to the callback of its "train"
+method, one record for each training iteration of Value Iteration and Policy
+Iteration, and one for each training iteration (episode) of Q-Learning
+'''
+
+class TrainingMetrics():
+    def __init__(self, verbose=False):
+        self.records = [] # Record of each training iteration
+        self.verbose = verbose # True to print each record as it comes
+
+    def __call__(self, record):
+        '''
+        This method receives the record of one training iteration
+
+        INPUT:
+            record(dict): Name and value of each measurement
+        '''
+        self.records.append(record)
+        if self.verbose:
+            print(', '.join(key + ': ' + str(value)
+                            for key, value in record.items()))
+
+    def column(self, key):
+        '''
+        This method lists one measurement of all training iterations
+
+        INPUT:
+            key(str): Name of the measurement
+        OUTPUT:
+            list: Value of the measurement in each record, None if missing
+        '''
+        return [record.get(key) for record in self.records]
+
+    def totals(self):
+        '''
+        This method adds up the counters of all training iterations
+
+        OUTPUT:
+            dict: Total of each counter found in the records
+        '''
+        totals = {}
+        for key in ['seconds', 'evaluation_seconds', 'improvement_seconds',
+                    'backups', 'steps', 'crashes', 'finishes',
+                    'policy_changes']:
+            values = [value for value in self.column(key) if value is not None]
+            if values:
+                totals[key] = sum(values)
+
+        return totals
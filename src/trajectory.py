@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+'''
+This class records the run of a test car in a growable array of 16-bit
+integers, one row for each step:
+
+    step, row, col, x velocity, y velocity, action, crashed
+
+The action is the index of the acceleration that led to the step, -1 for the
+start. Crashed is 1 if the car ran into a wall in the step
+'''
+
+import numpy as np
+
+FIELDS = ['step', 'row', 'col', 'vx', 'vy', 'action', 'crashed']
+MAX_STEPS = np.iinfo(np.int16).max # Largest step number that can be recorded
+
+class Trajectory():
+    def __init__(self, capacity=64):
+        self.data = np.empty((capacity, len(FIELDS)), dtype=np.int16)
+        self.size = 0 # Number of steps recorded
+
+    def append(self, step, position, velocity, action=-1, crashed=False):
+        '''
+        This method records one step. The array doubles in size when full.
+        A run longer than "MAX_STEPS" cannot be recorded
+
+        INPUT:
+            step(int): Number of the step
+            position(list): Coordinates of the car
+            velocity(list): Velocity of the car
+            action(int): Index of the acceleration, -1 if none
+            crashed(boolean): True if the car ran into a wall
+        '''
+        if step > MAX_STEPS:
+            raise ValueError('Test run is longer than ' + str(MAX_STEPS) +
+                             ' steps, so the policy may never reach the '
+                             'finish line')
+        if self.size == len(self.data):
+            data = np.empty((2 * len(self.data), len(FIELDS)), dtype=np.int16)
+            data[:self.size] = self.data
+            self.data = data
+
+        self.data[self.size] = (step, position[0], position[1], velocity[0],
+                                velocity[1], action, crashed)
+        self.size += 1
+
+    def array(self):
+        '''
+        This method gives the recorded steps
+
+        OUTPUT:
+            ndarray: One row for each step and one column for each field. The
+                     array is a view that later steps may overwrite, so it
+                     should be copied to be kept
+        '''
+        return self.data[:self.size]
+
+    def column(self, field):
+        '''
+        This method gives one field of all recorded steps
+
+        INPUT:
+            field(str): One of "FIELDS"
+        OUTPUT:
+            ndarray: The field of each step
+        '''
+        return self.data[:self.size, FIELDS.index(field)]
+
+    def positions(self):
+        '''
+        This method gives the coordinates of the car at each step
+
+        OUTPUT:
+            ndarray: Row and column of each step
+        '''
+        return self.data[:self.size, 1:3]
+
+    def velocities(self):
+        '''
+        This method gives the velocity of the car at each step
+
+        OUTPUT:
+            ndarray: x and y velocity of each step
+        '''
+        return self.data[:self.size, 3:5]
+
+    def clear(self):
+        '''
+        This method forgets the recorded steps but keeps the array for reuse
+        '''
+        self.size = 0
+
+    def __len__(self):
+        return self.size
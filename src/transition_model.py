@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+'''
+This class precomputes the dynamics of a race car on a racetrack. For every
+state-action pair it stores the next state and whether the car finishes or
+crashes, so that the learners do not have to simulate the car again and again
+'''
+
+from racetrack import Racetrack, PATH_FINISH, PATH_WALL
+from state_indexer import StateIndexer
+import numpy as np
+
+class TransitionModel():
+    def __init__(self, track, crash_type, indexer=None):
+        self.track = track # A Racetrack object
+        self.crash_type = crash_type # 0 for mild crash and 1 for harsh crash
+        self.accelerations = np.array([[-1,-1], [-1,0], [-1,1], [0,-1], [0,0],
+                                       [0,1], [1,-1], [1,0], [1,1]])
+        self.num_actions = len(self.accelerations)
+
+        # Numbers the states the car can be in
+        if indexer is None:
+            indexer = StateIndexer(track)
+        self.indexer = indexer
+        self.num_states = indexer.num_states
+
+        # Next state, finished flag and crashed flag of each state-action pair
+        self.next_state, self.finished, self.crashed = self.build()
+        self.order = None # States ordered by the distance to the finish line
+
+    def step(self, state, action):
+        '''
+        This method looks up the result of applying an action in a state
+
+        INPUT:
+            state(int): Index of the current state
+            action(int): Index of the acceleration in "accelerations"
+        OUTPUT:
+            int: Index of the next state
+            boolean: True if the car passes the finish line
+            boolean: True if the car runs into a wall
+        '''
+        return (int(self.next_state[state, action]),
+                bool(self.finished[state, action]),
+                bool(self.crashed[state, action]))
+
+    def predecessors(self):
+        '''
+        This method finds the states leading to each state. The states leading
+        to state s are "sources[pointers[s]:pointers[s + 1]]"
+
+        OUTPUT:
+            ndarray: Start of the predecessors of each state in "sources"
+            ndarray: Predecessors of all states, grouped by the next state
+        '''
+        moves = ~self.finished.reshape(-1)
+        targets = self.next_state.reshape(-1)[moves]
+        sources = np.repeat(np.arange(self.num_states), self.num_actions)[moves]
+        order = np.argsort(targets, kind='stable')
+        counts = np.bincount(targets, minlength=self.num_states)
+        pointers = np.concatenate([[0], np.cumsum(counts)])
+
+        return pointers, sources[order]
+
+    def backward_order(self):
+        '''
+        This method orders the states by the fewest number of steps needed to
+        pass the finish line. States that can never finish come last
+
+        OUTPUT:
+            ndarray: Indices of all states, closest to the finish line first
+        '''
+        if self.order is None:
+            pointers, sources = self.predecessors()
+            visited = np.zeros(self.num_states, dtype=bool)
+            frontier = np.flatnonzero(np.any(self.finished, axis=1))
+            visited[frontier] = True
+            levels = [frontier]
+            while len(frontier) > 0:
+                starts = pointers[frontier]
+                counts = pointers[frontier + 1] - starts
+                offsets = np.arange(counts.sum()) - np.repeat(
+                                        np.cumsum(counts) - counts, counts)
+                frontier = np.unique(sources[np.repeat(starts, counts) +
+                                             offsets])
+                frontier = frontier[~visited[frontier]]
+                visited[frontier] = True
+                levels.append(frontier)
+            levels.append(np.flatnonzero(~visited))
+            self.order = np.concatenate(levels)
+
+        return self.order
+
+    def build(self):
+        '''
+        This method simulates every state-action pair once, following the same
+        rules as "Agent.update_velocity" and "Agent.update_position". If the
+        car finishes, its position is left unchanged as in "Agent"
+
+        OUTPUT:
+            ndarray: Index of the next state of each state-action pair
+            ndarray: True where the car passes the finish line
+            ndarray: True where the car runs into a wall
+        '''
+        states = self.indexer.states
+        position = states[:, None, :2]
+        velocity = states[:, None, 2:] - 5
+
+        # Velocity cannot exceed the [-5, 5] bound
+        new_velocity = velocity + self.accelerations[None, :, :]
+        new_velocity = np.where(np.abs(new_velocity) <= 5, new_velocity,
+                                velocity)
+        new_position = position + new_velocity
+
+        # Same 3 conditions as "Agent.update_position"
+        if self.track.swept_path:
+            outcome = self.track.path_outcome(position, new_velocity)
+            finished = outcome == PATH_FINISH
+            crashed = outcome == PATH_WALL
+        else:
+            finished = self.check_finish_line(position, new_position)
+            crashed = self.track.is_wall(new_position) & ~finished
+
+        # The car is reset based on where it was before the crash
+        reset = self.crash_locations()[position[..., 0], position[..., 1]]
+        next_position = np.where(crashed[..., None], reset, new_position)
+        next_position = np.where(finished[..., None], position, next_position)
+        next_velocity = np.where(crashed[..., None], 0, new_velocity)
+
+        next_state = self.indexer.index[next_position[..., 0],
+                                        next_position[..., 1],
+                                        next_velocity[..., 0] + 5,
+                                        next_velocity[..., 1] + 5]
+
+        return next_state, finished, crashed
+
+    def crash_locations(self):
+        '''
+        This method finds where the car is reset to after a crash, for every
+        point in the racetrack
+
+        OUTPUT:
+            ndarray: Coordinates of the reset point of each point
+        '''
+        if self.crash_type == 0:
+            locations = self.track.track_locations
+            nearest = self.track.nearest_track
+        else:
+            locations = self.track.start_locations
+            nearest = self.track.nearest_start
+
+        return np.array(locations, dtype=int).reshape(-1, 2)[nearest]
+
+    def check_finish_line(self, positions1, positions2):
+        '''
+        This method checks if moves from "positions1" to "positions2" pass the
+        finish line, the same way as "Racetrack.check_finish_line"
+
+        INPUT:
+            positions1(ndarray): Coordinates of the current positions
+            positions2(ndarray): Coordinates of the next positions
+        OUTPUT:
+            ndarray: True where the car passes the finish line
+        '''
+        is_vertical, end1, end2 = self.track.finish_line
+        axis = 1 if is_vertical else 0 # Axis the finish line is crossed along
+        line = end1[axis]
+        across_line = ((line - positions1[..., axis]) *
+                       (line - positions2[..., axis])) <= 0
+        low = min(end1[1 - axis], end2[1 - axis])
+        high = max(end1[1 - axis], end2[1 - axis])
+        within_ends = ((low <= positions1[..., 1 - axis]) &
+                       (positions1[..., 1 - axis] <= high))
+
+        return across_line & within_ends
@@ -9,114 +9,453 @@ finish line in a minimum amount of time
 from racetrack import Racetrack
 from agent import Agent
 from helper import Helper
+from transition_model import TransitionModel
+from parallel_sweep import ParallelSweep
 import numpy as np
 import random
 import copy
+import heapq
+import time
 
 class ValueIteration(Helper):
-    def __init__(self, file):
-        racetrack = Racetrack(file)
-        Helper.__init__(self, racetrack)
+    tables = ['q_table', 'v_table', 'p_table'] # Tables saved by "save"
+
+    def __init__(self, file, reachable_only=False, swept_path=False):
+        racetrack = Racetrack(file, swept_path)
+        Helper.__init__(self, racetrack, reachable_only)
         self.accelerations = [[-1,-1], [-1,0], [-1,1], [0,-1], [0,0], [0,1], \
                               [1,-1], [1,0], [1,1]] # List of possible actions
         self.iterations = 0 # Number of training iterations
         self.past_value_difference = [] # Value difference of each iteration
-        self.q_table = self.initialize_q(len(self.track.track),
-                                         len(self.track.track[0]))
-        self.v_table = self.initialize_vp(len(self.track.track),
-                                          len(self.track.track[0]))
-        self.p_table = self.initialize_vp(len(self.track.track),
-                                          len(self.track.track[0]))
-
-    def train(self, iterations, crash_type):
+        self.backups = 0 # Number of times the value of a state is updated
+        self.failure_probability = 0.0 # Chance that accelerating fails
+        self.sweeper = None # Processes sharing the sweeps, if any
+        self.q_table = self.initialize_q(self.indexer.num_states)
+        self.v_table = self.initialize_vp(self.indexer.num_states)
+        self.p_table = self.initialize_vp(self.indexer.num_states)
+
+    def train(self, iterations, crash_type, vectorized=False,
+              schedule='synchronous', init_from=None, callback=None,
+              failure_probability=0.0, workers=1):
         '''
         This method trains the model
 
         INPUT:
             iterations(int): Maximum number of training iterations allowed
             crash_type(int): 0 for mild crash and 1 for harsh crash
+            vectorized(boolean): True to store the tables as NumPy arrays and
+                                 update all states at once in each iteration
+            schedule(str): Order of the updates. "synchronous" updates every
+                           state from the values of the last iteration,
+                           "gauss-seidel" updates the values in place and
+                           "prioritized" updates the states with the largest
+                           value difference first
+            init_from(Helper or str): Earlier solution to start from, as a
+                                      model or a path saved by "save"
+            callback(function): Called with a dict of measurements after
+                                each training iteration, such as
+                                "TrainingMetrics"
+            failure_probability(float): Chance that an attempt to accelerate
+                                        fails and [0, 0] is taken instead, 0
+                                        for deterministic moves and 0.2 as in
+                                        "QLearning.train"
+            workers(int): Number of processes sharing each synchronous
+                          sweep, all CPU cores if None. The result is the
+                          same as with one. Other schedules need 1
         OUTPUT:
             list: Maximum value difference between each pair of iterations
         '''
-        reward = -1
+        if workers != 1 and schedule != 'synchronous':
+            raise ValueError('workers only applies to the synchronous schedule')
         threshold = 0.1
         discount = 0.95
         max_delta_q = 0
-        car = self.initialize_car(crash_type)
+        self.crash_type = crash_type
+        self.failure_probability = failure_probability
+        self.hyperparameters = {'threshold': threshold, 'discount': discount,
+                                'schedule': schedule,
+                                'failure_probability': failure_probability}
+        model = TransitionModel(self.track, crash_type, self.indexer)
+        if init_from is not None:
+            self.warm_start(init_from)
+        if vectorized or schedule != 'synchronous' or workers != 1:
+            self.q_table = np.array(self.q_table, dtype=float)
+            self.v_table = np.array(self.v_table, dtype=float)
+        if callback is not None:
+            self.last_actions = self.greedy_actions(model, discount)
+        if schedule == 'prioritized':
+            self.prioritized_sweeping(model, discount, threshold, iterations,
+                                      callback)
+            self.extract_policy(model, discount)
+            print('Backups:', self.backups)
+            return self.past_value_difference
+        elif schedule == 'gauss-seidel':
+            sweep = self.sweep_gauss_seidel
+        elif workers != 1:
+            self.sweeper = ParallelSweep(model, discount, self.v_table,
+                                         failure_probability, workers)
+            sweep = self.sweep_parallel
+        elif vectorized:
+            sweep = self.sweep_vectorized
+        else:
+            sweep = self.sweep
+
+        # The processes and shared memory of a parallel sweep are freed even
+        # if training stops with an error
+        try:
+            # Keep training until the maximum value difference between 2
+            # iterations is less than the threshold, or maximum iterations
+            # are used
+            is_converged = False
+            while (not is_converged) and (self.iterations < iterations):
+                if callback is not None:
+                    start = time.perf_counter()
+                max_delta_q = sweep(model, discount)
+                self.backups += model.num_states
+                if callback is not None:
+                    self.report(callback, model, discount, start,
+                                model.num_states, max_delta_q)
+
+                # For demonstration purpose
+                print('Iteration:', self.iterations + 1)
+                print('Maximum value difference:', max_delta_q)
+
+                # Convergence criteria
+                if max_delta_q < threshold:
+                    is_converged = True
+
+                self.past_value_difference.append(max_delta_q)
+                self.iterations += 1
+
+            if schedule == 'gauss-seidel':
+                self.extract_policy(model, discount)
+            elif self.sweeper is not None:
+                # The Q table and the policy table come from the values the
+                # last sweep started from, as in "sweep_vectorized"
+                self.extract_policy(model, discount,
+                                    self.sweeper.values(previous=True))
+        finally:
+            if self.sweeper is not None:
+                self.sweeper.close()
+                self.sweeper = None
+        print('Backups:', self.backups)
 
-        # Keep training until the maximum value difference between 2 iterations
-        # is less than the threshold, or maximum iterations are used
-        is_converged = False
-        while (not is_converged) and (self.iterations < iterations):
-            old_v_table = copy.deepcopy(self.v_table)
-            max_delta_q = 0
-
-            # Update the value table and the policy table for each state
-            for i in range(len(self.v_table)):
-                y_position = self.v_table[i]
-                for j in range(len(y_position)):
-                    x_velocity = self.v_table[i][j]
-                    for k in range(len(x_velocity)):
-                        y_velocity = self.v_table[i][j][k]
-                        for l in range(len(y_velocity)):
-                            policy = [0, 0]
-                            max_q = -100000
-
-                            # Update the Q table for each state-action pair
-                            for m in range(len(self.accelerations)):
-                                acceleration = self.accelerations[m]
-                                car.position = [i, j]
-                                car.velocity = [k - 5, l - 5]
-
-                                # Update position after updating velocity
-                                car.update_velocity(acceleration)
-                                has_finished = car.update_position()
-                                new_x_velocity = car.velocity[0] + 5
-                                new_y_velocity = car.velocity[1] + 5
-                                new_x_position = car.position[0]
-                                new_y_position = car.position[1]
-
-                                # Calculate the value of the next state
-                                new_v = 0
-                                reward = -1
-                                if has_finished:
-                                    reward = 0
-                                else:
-                                    new_v = old_v_table[new_x_position] \
-                                                       [new_y_position] \
-                                                       [new_x_velocity] \
-                                                       [new_y_velocity]
-
-                                # Calculate Q value of the state-action pair
-                                new_q = reward + discount*new_v
-                                self.q_table[i][j][k][l][m] = new_q
-
-                                if new_q > max_q:
-                                    policy = acceleration
-                                    max_q = new_q
-
-                            # Based on the best action, update correspondingly
-                            old_q = self.v_table[i][j][k][l]
-                            self.v_table[i][j][k][l] = max_q
-                            self.p_table[i][j][k][l] = policy
-
-                            # Calculate the maximum value difference
-                            delta_q = old_q - max_q
-                            if delta_q > max_delta_q:
-                                max_delta_q = delta_q
+        return self.past_value_difference
 
-            # For demonstration purpose
-            print('Iteration:', self.iterations + 1)
-            print('Maximum value difference:', max_delta_q)
+    def sweep(self, model, discount):
+        '''
+        This method updates the Q table, the value table and the policy table
+        for each state, one state-action pair at a time
+
+        INPUT:
+            model(TransitionModel): Transitions of the racetrack
+            discount(float): Discount factor
+        OUTPUT:
+            float: Maximum value difference between the old and new values
+        '''
+        next_states = model.next_state.tolist()
+        finished = model.finished.tolist()
+        old_v_table = list(self.v_table)
+        failure_probability = self.failure_probability
+        max_delta_q = 0
+
+        # Update the value table and the policy table for each state
+        for s in range(model.num_states):
+            policy = [0, 0]
+            max_q = -100000
+
+            # Part of the Q values from [0, 0], taken when accelerating fails
+            stay = 0.0
+            if failure_probability > 0 and not finished[s][4]:
+                stay = failure_probability*(-1 + discount*
+                                            old_v_table[next_states[s][4]])
+
+            # Update the Q table for each state-action pair
+            for m in range(len(self.accelerations)):
+                # Calculate the value of the next state
+                new_v = 0
+                reward = -1
+                if finished[s][m]:
+                    reward = 0
+                else:
+                    new_v = old_v_table[next_states[s][m]]
+
+                # Calculate Q value of the state-action pair
+                new_q = reward + discount*new_v
+                if failure_probability > 0:
+                    new_q = (1 - failure_probability)*new_q + stay
+                self.q_table[s][m] = new_q
+
+                if new_q > max_q:
+                    policy = self.accelerations[m]
+                    max_q = new_q
+
+            # Based on the best action, update correspondingly
+            old_q = self.v_table[s]
+            self.v_table[s] = max_q
+            self.p_table[s] = policy
+
+            # Calculate the maximum value difference
+            delta_q = old_q - max_q
+            if delta_q > max_delta_q:
+                max_delta_q = delta_q
+
+        return max_delta_q
+
+    def sweep_vectorized(self, model, discount):
+        '''
+        This method updates the Q table, the value table and the policy table
+        for all states at once. The tables are NumPy arrays
+
+        INPUT:
+            model(TransitionModel): Transitions of the racetrack
+            discount(float): Discount factor
+        OUTPUT:
+            float: Maximum value difference between the old and new values
+        '''
+        old_v = self.v_table
+        q = self.q_values(model, discount, old_v)
+        best = np.argmax(q, axis=1)
+        max_q = q[np.arange(len(q)), best]
+        max_delta_q = max(0, np.max(old_v - max_q))
+
+        self.q_table = q
+        self.v_table = max_q
+        self.p_table = model.accelerations[best]
+
+        return float(max_delta_q)
+
+    def sweep_parallel(self, model, discount):
+        '''
+        This method updates the value table for all states at once, with the
+        states split between the processes of "ParallelSweep". The Q table
+        and the policy table are updated once training ends
+
+        INPUT:
+            model(TransitionModel): Transitions of the racetrack
+            discount(float): Discount factor
+        OUTPUT:
+            float: Maximum value difference between the old and new values
+        '''
+        max_delta_q = self.sweeper.sweep()
+        self.v_table = self.sweeper.values()
+
+        return max_delta_q
+
+    def sweep_gauss_seidel(self, model, discount):
+        '''
+        This method updates the value table for each state in place, so that
+        states later in the iteration already use the new values
+
+        INPUT:
+            model(TransitionModel): Transitions of the racetrack
+            discount(float): Discount factor
+        OUTPUT:
+            float: Maximum value difference between the old and new values
+        '''
+        next_states = model.next_state.tolist()
+        finished = model.finished.tolist()
+        v_table = self.v_table.tolist()
+        failure_probability = self.failure_probability
+        max_delta_q = 0
+
+        # States closer to the finish line are updated first, so that the
+        # states leading to them already use their new values
+        for s in model.backward_order().tolist():
+            max_q = -100000
+            stay = 0.0
+            if failure_probability > 0 and not finished[s][4]:
+                stay = failure_probability*(-1 + discount*
+                                            v_table[next_states[s][4]])
+            for m in range(model.num_actions):
+                new_q = 0.0
+                if not finished[s][m]:
+                    new_q = -1 + discount*v_table[next_states[s][m]]
+                if failure_probability > 0:
+                    new_q = (1 - failure_probability)*new_q + stay
+                if new_q > max_q:
+                    max_q = new_q
+
+            delta_q = v_table[s] - max_q
+            v_table[s] = max_q
+            if delta_q > max_delta_q:
+                max_delta_q = delta_q
+
+        self.v_table = np.array(v_table)
+
+        return max_delta_q
+
+    def prioritized_sweeping(self, model, discount, threshold, iterations,
+                             callback=None):
+        '''
+        This method updates the value table one state at a time, always picking
+        the state with the largest value difference. After a state is updated,
+        the value differences of the states leading to it are recalculated,
+        which takes a backup of each of them too. Every time as many backups
+        as there are states are done, it counts as one training iteration
 
-            # Convergence criteria
-            if max_delta_q < threshold:
-                is_converged = True
+        INPUT:
+            model(TransitionModel): Transitions of the racetrack
+            discount(float): Discount factor
+            threshold(float): Value difference below which a state is skipped
+            iterations(int): Maximum number of training iterations allowed
+            callback(function): Called with a dict of measurements after
+                                each training iteration
+        '''
+        next_states = model.next_state.tolist()
+        finished = model.finished.tolist()
+        pointers, sources = model.predecessors()
+        pointers = pointers.tolist()
+        sources = sources.tolist()
+        v_table = self.v_table.tolist()
+        failure_probability = self.failure_probability
+
+        def backup(s):
+            max_q = -100000
+            stay = 0.0
+            if failure_probability > 0 and not finished[s][4]:
+                stay = failure_probability*(-1 + discount*
+                                            v_table[next_states[s][4]])
+            for m in range(model.num_actions):
+                new_q = 0.0
+                if not finished[s][m]:
+                    new_q = -1 + discount*v_table[next_states[s][m]]
+                if failure_probability > 0:
+                    new_q = (1 - failure_probability)*new_q + stay
+                if new_q > max_q:
+                    max_q = new_q
+            return max_q
+
+        # Start with the value difference of every state
+        q = self.q_values(model, discount, self.v_table)
+        priority = np.abs(np.max(q, axis=1) - self.v_table).tolist()
+        queue = [(-delta, s) for s, delta in enumerate(priority)
+                 if delta >= threshold]
+        heapq.heapify(queue)
+
+        max_backups = (iterations - self.iterations) * model.num_states
+        backups = 0 # Backups of updated states and of their predecessors
+        reported = 0 # Backups in the training iterations already counted
+        start = time.perf_counter()
+        while queue and backups < max_backups:
+            delta, s = heapq.heappop(queue)
+            if -delta != priority[s]:
+                continue # A newer entry of the state is in the queue
+            priority[s] = 0
+            v_table[s] = backup(s)
+            backups += 1
+
+            predecessors = set(sources[pointers[s]:pointers[s + 1]])
+            for p in predecessors:
+                new_delta = abs(backup(p) - v_table[p])
+                if new_delta >= threshold and new_delta > priority[p]:
+                    priority[p] = new_delta
+                    heapq.heappush(queue, (-new_delta, p))
+            backups += len(predecessors)
 
-            self.past_value_difference.append(max_delta_q)
+            # For demonstration purpose
+            if backups - reported >= model.num_states:
+                if callback is not None:
+                    self.v_table = np.array(v_table)
+                    self.report(callback, model, discount, start,
+                                backups - reported, -delta)
+                    start = time.perf_counter()
+                reported = backups
+                self.iterations += 1
+                self.past_value_difference.append(-delta)
+                print('Iteration:', self.iterations)
+                print('Maximum value difference:', -delta)
+
+        if backups > reported:
+            residual = -queue[0][0] if queue else 0
+            if callback is not None:
+                self.v_table = np.array(v_table)
+                self.report(callback, model, discount, start,
+                            backups - reported, residual)
             self.iterations += 1
+            self.past_value_difference.append(residual)
 
-        return self.past_value_difference
+        self.backups += backups
+        self.v_table = np.array(v_table)
+
+    def greedy_actions(self, model, discount):
+        '''
+        This method finds the best action of each state from the values in
+        the value table
+
+        INPUT:
+            model(TransitionModel): Transitions of the racetrack
+            discount(float): Discount factor
+        OUTPUT:
+            ndarray: Index of the best action of each state
+        '''
+        v_table = np.asarray(self.v_table, dtype=float)
+        q = self.q_values(model, discount, v_table)
+
+        return np.argmax(q, axis=1)
+
+    def q_values(self, model, discount, v_table):
+        '''
+        This method finds the Q value of every state-action pair at once.
+        When accelerating can fail, a Q value is the expected value over
+        taking the chosen action and taking [0, 0], whose Q values are
+        already in the table, so only one more column is read
+
+        INPUT:
+            model(TransitionModel): Transitions of the racetrack
+            discount(float): Discount factor
+            v_table(ndarray): Value of each state
+        OUTPUT:
+            ndarray: Q value of each state-action pair
+        '''
+        # Reward is 0 when the car passes the finish line and -1 otherwise
+        q = np.where(model.finished, 0.0, -1 + discount*v_table[model.next_state])
+        failure_probability = self.failure_probability
+        if failure_probability > 0:
+            q = (1 - failure_probability)*q + failure_probability*q[:, 4:5]
+
+        return q
+
+    def report(self, callback, model, discount, start, backups, residual):
+        '''
+        This method passes the measurements of one training iteration to the
+        callback
+
+        INPUT:
+            callback(function): Called with a dict of measurements
+            model(TransitionModel): Transitions of the racetrack
+            discount(float): Discount factor
+            start(float): Time the training iteration started at
+            backups(int): Number of backups in the training iteration
+            residual(float): Maximum value difference of the iteration
+        '''
+        seconds = time.perf_counter() - start
+        actions = self.greedy_actions(model, discount)
+        policy_changes = int(np.sum(actions != self.last_actions))
+        self.last_actions = actions
+
+        callback({'model': 'ValueIteration',
+                  'crash_type': model.crash_type,
+                  'iteration': self.iterations + 1,
+                  'seconds': seconds,
+                  'backups': backups,
+                  'residual': float(residual),
+                  'policy_changes': policy_changes})
+
+    def extract_policy(self, model, discount, v_table=None):
+        '''
+        This method updates the Q table and the policy table from the values
+        in the value table
+
+        INPUT:
+            model(TransitionModel): Transitions of the racetrack
+            discount(float): Discount factor
+            v_table(ndarray): Values to use instead of the value table
+        '''
+        if v_table is None:
+            v_table = self.v_table
+        self.q_table = self.q_values(model, discount, v_table)
+        self.p_table = model.accelerations[np.argmax(self.q_table, axis=1)]
 
     def test(self, crash_type, write_to_file=False):
         '''
@@ -131,7 +470,7 @@ class ValueIteration(Helper):
         '''
         car = self.initialize_car(crash_type)
         self.iter = 0
-        self.record.append(car.position)
+        self.record.append(0, car.position, car.velocity)
 
         # Allow the test car to run on the racetrack until it reaches the goal
         finish = False
@@ -141,15 +480,15 @@ class ValueIteration(Helper):
                 self.print_one(car)
 
             # Find the policy for current state
-            i = car.position[0]
-            j = car.position[1]
-            k = car.velocity[0] + 5
-            l = car.velocity[1] + 5
-            acceleration = self.p_table[i][j][k][l]
+            state = self.indexer.state_index(car.position, car.velocity)
+            # The policy table may be a NumPy array, whose rows would make
+            # the velocity a list of NumPy integers
+            acceleration = [int(a) for a in self.p_table[state]]
+            action = (acceleration[0] + 1)*3 + (acceleration[1] + 1)
 
             # Accelerate and move to the next state
             car.update_velocity(acceleration)
-            finish = self.act(car)
+            finish = self.act(car, action)
 
         # For demonstration purpose
         if not write_to_file:
@@ -159,52 +498,32 @@ class ValueIteration(Helper):
 
         return self.iter
 
-    def initialize_q(self, x_size, y_size):
+    def initialize_q(self, num_states):
         '''
         This method initializes the Q table
 
         INPUT:
-            x_size(int): The width of the racetrack
-            y_size(int): The height of the racetrack
+            num_states(int): Number of states the car can be in
         '''
         q_table = []
-        for i in range(x_size):
-            x_position = []
-            for j in range(y_size):
-                y_position = []
-                for k in range(-5, 6):
-                    x_velocity = []
-                    for l in range(-5, 6):
-                        y_velocity = []
-                        for m in range(len(self.accelerations)):
-                            y_velocity.append(0)
-                        x_velocity.append(y_velocity)
-                    y_position.append(x_velocity)
-                x_position.append(y_position)
-            q_table.append(x_position)
+        for i in range(num_states):
+            q_values = []
+            for m in range(len(self.accelerations)):
+                q_values.append(0)
+            q_table.append(q_values)
 
         return q_table
 
-    def initialize_vp(self, x_size, y_size):
+    def initialize_vp(self, num_states):
         '''
         This method initializes the value table and the policy table
 
         INPUT:
-            x_size(int): The width of the racetrack
-            y_size(int): The height of the racetrack
+            num_states(int): Number of states the car can be in
         '''
         vp_table = []
-        for i in range(x_size):
-            x_position = []
-            for j in range(y_size):
-                y_position = []
-                for k in range(11):
-                    x_velocity = []
-                    for l in range(11):
-                        x_velocity.append(0)
-                    y_position.append(x_velocity)
-                x_position.append(y_position)
-            vp_table.append(x_position)
+        for i in range(num_states):
+            vp_table.append(0)
 
         return vp_table
 
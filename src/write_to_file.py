@@ -1,127 +1,340 @@
 #!/usr/bin/env python3
 
 '''
-Run this module to perform Value Iteration and Q-Learning on "L-track" and
-"R-track" with two crash scenarios. Training processes and test resluts are
-written to files. Figures of learning curves are also created
+Run this module to perform Value Iteration, Policy Iteration and Q-Learning on
+"L-track" and "R-track" with two crash scenarios. Training processes and test
+resluts are written to compact files by "ResultsWriter", and optionally to
+text files. Figures of learning curves are also created. Each track, model and
+crash scenario is trained in its own process. Run it with "--help" to choose
+the racetracks, models, crash types, budgets and outputs
 '''
 
 from value_iteration import ValueIteration
+from policy_iteration import PolicyIteration
 from q_learning import QLearning
-import matplotlib.pyplot as plt
+from racetrack import read_track
+from results_writer import ResultsWriter, render_trajectory
+from policy_evaluator import PolicyEvaluator
+from trajectory import MAX_STEPS
+from multiprocessing import Pool
+import numpy as np
+import contextlib
+import argparse
+import random
+import io
+import os
 
-def main():
-    tracks = ['L-track.txt', 'R-track.txt']
-    models = [ValueIteration, QLearning]
-    for track in tracks:
-        out_file = open(track[:7] + '-output.txt', 'w')
-        out_file.write('Perform reinforcement learning on ' + track + '\n')
-        for model in models:
-            if model == ValueIteration:
-                iterations = 1000
-                out_file.write('\n')
-                out_file.write(' --------------- \n')
-                out_file.write('|Value Iteration|\n')
-                out_file.write(' --------------- \n')
-                for crash_type in ([0, 1]):
-                    if crash_type == 0:
-                        crash = 'Mild Crash'
-                    else:
-                        crash = 'Harsh Crash'
-                    r_learning = model(track)
-                    learning_curve = r_learning.train(iterations, crash_type)
-                    out_file.write('\n')
-                    out_file.write(crash + '\n')
-                    out_file.write('----------\n')
-                    out_file.write('\n')
-                    out_file.write('Training process:\n')
-                    out_file.write('\n')
-                    out_file.write('              Max value difference\n')
-                    for i in range(len(learning_curve)):
-                        out_file.write('Iteration #' + str(i + 1) + ': ' + str(learning_curve[i]) + '\n')
-                    out_file.write('\n')
-                    out_file.write('--> Values converged!\n')
-
-                    plt.close()
-                    plt.plot(learning_curve)
-                    plt.title(track[:7] + 'Value Iteration - ' + crash)
-                    plt.xlabel('Iteration #')
-                    plt.ylabel('Maximum value difference')
-                    if crash_type == 0:
-                        plt.savefig(track[:7] + '-value-iteration-mild-crash-learning-curve.png')
-                    else:
-                        plt.savefig(track[:7] + '-value-iteration-harsh-crash-learning-curve.png')
-
-
-                    out_file.write('\n')
-                    out_file.write('Testing:\n')
-                    average_steps = 0
-                    for i in range(10):
-                        steps = r_learning.test(crash_type, True)
-                        average_steps += steps
-                        out_file.write('\n')
-                        out_file.write('Test run #' + str(i + 1) + '\n')
-                        r_learning.write_all(out_file)
-                    average_steps /= 10
-                    out_file.write('\n')
-                    out_file.write('-----------------------\n')
-                    out_file.write('Average steps taken: ' + str(average_steps + 1) + '\n')
-                    out_file.write('\n')
-
-            else:
+# Name, learning curve label, convergence message, y label and file name of
+# the figure for each model
+MODELS = {
+    ValueIteration: ('Value Iteration', 'Max value difference',
+                     'Values converged!', 'Maximum value difference',
+                     'value-iteration'),
+    PolicyIteration: ('Policy Iteration', 'Policy changes',
+                      'Policy converged!', 'Policy changes',
+                      'policy-iteration'),
+    QLearning: ('Q-Learning', 'Steps taken before finding the finish line',
+                'Training completed!', 'Steps taken', 'Q-learning'),
+}
+
+def track_name(track):
+    '''
+    This function names a racetrack after its file, e.g. "L-track"
+
+    INPUT:
+        track(str): Track file
+    OUTPUT:
+        str: Name of the racetrack
+    '''
+    return os.path.splitext(os.path.basename(track))[0]
+
+def run_job(job):
+    '''
+    This function trains and tests one model on one track with one type of
+    crash. Anything printed by the model is discarded
+
+    INPUT:
+        job(tuple): Track file, model class, crash type, random seed,
+                    maximum number of training iterations and maximum number
+                    of steps in each Q-Learning training iteration. Budgets
+                    that are None are set for "L-track" and "R-track"
+    OUTPUT:
+        list: Learning curve of the training process
+        list: Array of the steps of the test car in each test run, as
+              "Trajectory.array". There are no test runs if the test car of
+              Value Iteration or Policy Iteration would never finish
+        float: Average number of steps taken in the test runs, None if there
+               are none
+        dict: Steps needed from every start point, the fraction of them
+              that never reach the finish line and whether the car always
+              finishes, by "PolicyEvaluator"
+    '''
+    track, model, crash_type, seed, iterations, max_steps = job
+    random.seed(seed)
+    np.random.seed(seed)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        r_learning = model(track)
+        if model == QLearning:
+            if iterations is None:
                 iterations = 10000
+            if max_steps is None:
                 max_steps = 1000
-                if track == 'R-track.txt':
+                if track_name(track) == 'R-track':
                     max_steps = 10000
-                out_file.write('\n')
-                out_file.write(' ---------- \n')
-                out_file.write('|Q-Learning|\n')
-                out_file.write(' ---------- \n')
-                for crash_type in ([0, 1]):
-                    if crash_type == 0:
-                        crash = 'Mild Crash'
-                    else:
-                        crash = 'Harsh Crash'
-                    r_learning = model(track)
-                    learning_curve = r_learning.train(iterations, crash_type, max_steps)
-                    out_file.write('\n')
-                    out_file.write(crash + '\n')
-                    out_file.write('----------\n')
-                    out_file.write('\n')
-                    out_file.write('Training process:\n')
-                    out_file.write('\n')
-                    out_file.write('              Steps taken before finding the finish line\n')
-                    for i in range(len(learning_curve)):
-                        out_file.write('Iteration #' + str(i + 1) + ': ' + str(learning_curve[i]) + '\n')
-                    out_file.write('\n')
-                    out_file.write('--> Training completed!\n')
-
-                    plt.close()
-                    plt.plot(learning_curve)
-                    plt.title(track[:7] + 'Q-Learning - ' + crash)
-                    plt.xlabel('Iteration #')
-                    plt.ylabel('Steps taken')
-                    if crash_type == 0:
-                        plt.savefig(track[:7] + '-Q-learning-mild-crash-learning-curve.png')
-                    else:
-                        plt.savefig(track[:7] + '-Q-learning-harsh-crash-learning-curve.png')
-
-                    out_file.write('\n')
-                    out_file.write('Testing:\n')
-                    average_steps = 0
-                    for i in range(10):
-                        steps = r_learning.test(crash_type, True)
-                        average_steps += steps
-                        out_file.write('\n')
-                        out_file.write('Test run #' + str(i + 1) + '\n')
-                        r_learning.write_all(out_file)
-                    average_steps /= 10
-                    out_file.write('\n')
-                    out_file.write('-----------------------\n')
-                    out_file.write('Average steps taken: ' + str(average_steps + 1) + '\n')
-                    out_file.write('\n')
-
-        out_file.close()
+            learning_curve = r_learning.train(iterations, crash_type, max_steps)
+        else:
+            if iterations is None:
+                iterations = 1000
+            learning_curve = r_learning.train(iterations, crash_type)
+
+    # The test runs are deterministic, so one run from each start point
+    # covers them all
+    evaluator = PolicyEvaluator(r_learning, crash_type)
+    steps = evaluator.monte_carlo(1)['steps']
+    finished = steps[steps >= 0]
+    always_finishes = bool(np.max(evaluator.exact()['expected_steps']) <
+                           MAX_STEPS)
+    evaluation = {'start_steps': steps[:, 0].tolist(),
+                  'mean_steps': float(finished.mean()) if len(finished)
+                                else None,
+                  'failure_rate': float(np.mean(steps < 0)),
+                  'always_finishes': always_finishes}
+
+    # The test runs of Value Iteration and Policy Iteration have no step
+    # limit, so they are only done if the car always finishes
+    trajectories = []
+    average_steps = None
+    if model == QLearning or always_finishes:
+        average_steps = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(10):
+                steps = r_learning.test(crash_type, True)
+                average_steps += steps
+                trajectories.append(r_learning.record.array().copy())
+                r_learning.record.clear()
+        average_steps /= 10
+
+    return learning_curve, trajectories, average_steps, evaluation
+
+def write_results(out_file, track, model, crash_type, results):
+    '''
+    This function writes the training process and test runs of one job to the
+    text output file
+
+    INPUT:
+        out_file(_io.TextIOWrapper): The output file being written to
+        track(str): Track file
+        model(type): Model class
+        crash_type(int): 0 for mild crash and 1 for harsh crash
+        results(tuple): Output of "run_job"
+    '''
+    name, label, message, y_label, figure = MODELS[model]
+    learning_curve, trajectories, average_steps = results[:3]
+    if crash_type == 0:
+        crash = 'Mild Crash'
+    else:
+        crash = 'Harsh Crash'
+
+    out_file.write('\n')
+    out_file.write(crash + '\n')
+    out_file.write('----------\n')
+    out_file.write('\n')
+    out_file.write('Training process:\n')
+    out_file.write('\n')
+    out_file.write('              ' + label + '\n')
+    for i in range(len(learning_curve)):
+        out_file.write('Iteration #' + str(i + 1) + ': ' + str(learning_curve[i]) + '\n')
+    out_file.write('\n')
+    out_file.write('--> ' + message + '\n')
+
+    racetrack = read_track(track)
+    out_file.write('\n')
+    out_file.write('Testing:\n')
+    for i in range(len(trajectories)):
+        out_file.write('\n')
+        out_file.write('Test run #' + str(i + 1) + '\n')
+        out_file.write(render_trajectory(racetrack, trajectories[i][:, 1:3]))
+    out_file.write('\n')
+    out_file.write('-----------------------\n')
+    if average_steps is None:
+        out_file.write('No test runs: the test car never reaches the finish '
+                       'line from some start points\n')
+    else:
+        out_file.write('Average steps taken: ' + str(average_steps + 1) +
+                       '\n')
+    out_file.write('\n')
+
+def plot_results(out_dir, track, model, crash_type, learning_curve):
+    '''
+    This function saves the figure of the learning curve of one job.
+    Matplotlib is only imported here, with a backend that needs no display
+
+    INPUT:
+        out_dir(str): Directory the figure is saved to
+        track(str): Track file
+        model(type): Model class
+        crash_type(int): 0 for mild crash and 1 for harsh crash
+        learning_curve(list): Learning curve of the training process
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    name, label, message, y_label, figure = MODELS[model]
+    if crash_type == 0:
+        crash = 'Mild Crash'
+    else:
+        crash = 'Harsh Crash'
+
+    plt.close()
+    plt.plot(learning_curve)
+    plt.title(track_name(track) + name + ' - ' + crash)
+    plt.xlabel('Iteration #')
+    plt.ylabel(y_label)
+    if crash_type == 0:
+        plt.savefig(os.path.join(out_dir, track_name(track) + '-' + figure +
+                                 '-mild-crash-learning-curve.png'))
+    else:
+        plt.savefig(os.path.join(out_dir, track_name(track) + '-' + figure +
+                                 '-harsh-crash-learning-curve.png'))
+
+def main(workers=None, seed=0, out_dir='results', downsample=1, text=False,
+         tracks=None, models=None, crash_types=(0, 1), iterations=None,
+         steps=None, plot=True):
+    '''
+    This function runs every job of the grid in a pool of processes and
+    writes the results to the output files
+
+    INPUT:
+        workers(int): Number of processes, all CPU cores if None
+        seed(int): Random seed of the first job. The other jobs use the
+                   following seeds in order, so results do not depend on
+                   which process runs a job
+        out_dir(str): Directory all the output files are written to
+        downsample(int): Only every n-th point of the learning curves is
+                         written to "ResultsWriter"
+        text(boolean): True to also write the full text output files
+        tracks(list): Track files, "L-track" and "R-track" if None
+        models(list): Model classes, all 3 models if None
+        crash_types(tuple): Crash types, 0 for mild and 1 for harsh
+        iterations(int): Maximum number of training iterations, the default
+                         of each model if None
+        steps(int): Maximum number of steps in each Q-Learning training
+                    iteration, the default of each racetrack if None
+        plot(boolean): True to save the figures of the learning curves
+    '''
+    if tracks is None:
+        tracks = ['L-track.txt', 'R-track.txt']
+    if models is None:
+        models = [ValueIteration, PolicyIteration, QLearning]
+    jobs = []
+    for track in tracks:
+        for model in models:
+            for crash_type in crash_types:
+                jobs.append((track, model, crash_type, seed + len(jobs),
+                             iterations, steps))
+
+    # The slowest jobs are at the end of the grid, so they are started first
+    if workers is None:
+        workers = os.cpu_count()
+    workers = min(workers, len(jobs))
+    if workers == 1:
+        results = [run_job(job) for job in jobs]
+    else:
+        with Pool(workers) as pool:
+            results = pool.map(run_job, jobs[::-1], chunksize=1)[::-1]
+
+    # Write the results in the order of the grid
+    with ResultsWriter(out_dir, downsample) as writer:
+        for job, job_results in zip(jobs, results):
+            track, model, crash_type, job_seed = job[:4]
+            learning_curve, trajectories, average_steps, evaluation = \
+                                                                    job_results
+            run = (track_name(track) + '-' + MODELS[model][4] + '-' +
+                   str(crash_type))
+            writer.write_curve(run, learning_curve)
+            writer.write_test_runs(run, trajectories)
+            writer.write_summary(run, {'track': track,
+                                       'model': MODELS[model][0],
+                                       'crash_type': crash_type,
+                                       'seed': job_seed,
+                                       'iterations': len(learning_curve),
+                                       'average_steps':
+                                           None if average_steps is None
+                                           else average_steps + 1,
+                                       **evaluation})
+            if plot:
+                plot_results(out_dir, track, model, crash_type,
+                             learning_curve)
+
+    if not text:
+        return
+
+    out_file = None
+    previous_track = None
+    for job, job_results in zip(jobs, results):
+        track, model, crash_type = job[:3]
+        if track != previous_track:
+            if out_file is not None:
+                out_file.close()
+            out_file = open(os.path.join(out_dir, track_name(track) +
+                                         '-output.txt'), 'w')
+            out_file.write('Perform reinforcement learning on ' +
+                           os.path.basename(track) + '\n')
+            previous_track = track
+            previous_model = None
+        if model != previous_model:
+            name = MODELS[model][0]
+            out_file.write('\n')
+            out_file.write(' ' + '-' * len(name) + ' \n')
+            out_file.write('|' + name + '|\n')
+            out_file.write(' ' + '-' * len(name) + ' \n')
+            previous_model = model
+        write_results(out_file, track, model, crash_type, job_results)
+    out_file.close()
+
+def parse_args(args=None):
+    '''
+    This function reads the options of the command line
+
+    INPUT:
+        args(list): Options, those of the command line if None
+    OUTPUT:
+        argparse.Namespace: Value of each option
+    '''
+    model_names = {MODELS[model][4].lower(): model for model in MODELS}
+    parser = argparse.ArgumentParser(description='Train and test the models '
+                                     'without asking for input')
+    parser.add_argument('--tracks', nargs='+',
+                        default=['L-track.txt', 'R-track.txt'],
+                        help='racetrack files')
+    parser.add_argument('--models', nargs='+', choices=list(model_names),
+                        default=list(model_names))
+    parser.add_argument('--crash-types', nargs='+', type=int, choices=[0, 1],
+                        default=[0, 1], help='0 for mild and 1 for harsh')
+    parser.add_argument('--iterations', type=int,
+                        help='maximum number of training iterations')
+    parser.add_argument('--steps', type=int, help='maximum number of steps '
+                        'in each Q-Learning training iteration')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int,
+                        help='number of processes, all CPU cores by default')
+    parser.add_argument('--out-dir', default='results',
+                        help='directory the output files are written to')
+    parser.add_argument('--downsample', type=int, default=1,
+                        help='keep every n-th point of the learning curves')
+    parser.add_argument('--text', action='store_true',
+                        help='also write the full text output files')
+    parser.add_argument('--no-plot', action='store_true',
+                        help='do not save figures of the learning curves')
+    args = parser.parse_args(args)
+    args.models = [model_names[name] for name in args.models]
+
+    return args
 
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    main(args.workers, args.seed, args.out_dir, args.downsample, args.text,
+         args.tracks, args.models, args.crash_types, args.iterations,
+         args.steps, not args.no_plot)